@@ -0,0 +1,73 @@
+import asyncio
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+import instrumentation
+from transport import HostLimiter, host_limiter
+from url_reader import read_url, read_url_loop, pages_to_array, decode, to_frame
+
+
+class AsyncReader:
+    '''
+    Asyncio front-end for url_reader.
+    Blocking requests run in a thread pool on one shared session (url_reader.transport
+    when session is None), and the number of requests in flight to the same host
+    is bounded by max_per_host. The bound holds for every request a call sends,
+    including the ones its page and shard pools send from other threads.
+    Cancelling an awaiting task drops its call if it has not started yet.
+    '''
+
+    def __init__(self, max_per_host: int = 8, max_workers: int = 32, session=None):
+        self.max_per_host = max_per_host
+        self.session = session
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.limiter = HostLimiter(max_per_host)
+
+    async def call(self, func, *args, **kwargs):
+        '''Runs a blocking callable in the pool, every request it sends holds a slot of its host'''
+        context = contextvars.copy_context()
+        context.run(host_limiter.set, self.limiter)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(context.run, func, *args, **kwargs))
+
+    async def read_url(self, url: str, **kwargs):
+        '''Async counterpart of url_reader.read_url'''
+        return await self.call(read_url, url, session=self.session, **kwargs)
+
+    async def url_processed(self, url, table: str, **kwargs):
+        '''Async counterpart of url_reader.url_processed'''
+        response = await self.read_url(url, table=table, **kwargs)
+        data = decode(response)[table]
+        df = to_frame(data['data'], data['columns'], data['metadata'], getattr(response, 'iss_endpoint', None))
+        return df
+
+    async def loop_processed(self, url, table: str, **kwargs):
+        '''Async counterpart of url_reader.loop_processed'''
+        response = await self.call(read_url_loop, url, table, session=self.session, **kwargs)
+        meta = response[0][table]['metadata']
+        cols = response[0][table]['columns']
+        df = to_frame(pages_to_array(response, table), cols, meta, instrumentation.endpoint(url))
+        return df
+
+    async def gather(self, func, tickers, return_exceptions: bool = False):
+        '''
+        Calls func(ticker) for every ticker concurrently and returns a dict {ticker: result}.
+        With return_exceptions=True failed tickers map to their exception instead of
+        cancelling the whole batch.
+        '''
+        tickers = list(tickers)
+        tasks = [self.call(func, ticker) for ticker in tickers]
+        results = await asyncio.gather(*tasks, return_exceptions=return_exceptions)
+        return dict(zip(tickers, results))
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        if self.session is not None:
+            self.session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
@@ -0,0 +1,289 @@
+import sys
+import json
+import time
+import argparse
+import statistics
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import moex_functions as mfunc
+import iss_emulator
+from moex_reader import Moex
+from security_cache import security_cache
+
+# dataset sizes and emulator settings used when nothing else is given
+default_config = {'tickers': 200,
+                  'bonds': 1000,
+                  'schedules': 100,
+                  'schedule_rows': 3000,
+                  'years': 5,
+                  'interval': 10,
+                  'rows': 100000,
+                  'columns': 40,
+                  'grid': 1000000,
+                  'latency': 0.0,
+                  'repeat': 3,
+                  'seed': 0}
+
+
+def _tickers(emulator, n):
+    '''First n tickers of the emulated universe, shares first and then live bonds'''
+    bonds = emulator.bonds
+    live = bonds.index[(bonds['issuedate'] < emulator.today) & (bonds['matdate'] > emulator.today)]
+    return (list(emulator.shares.index) + list(live))[:n]
+
+
+def _wide_table(rows, columns, seed):
+    '''Object table with ISS metadata in the shape url_reader hands to make_new_types'''
+    rng = np.random.default_rng(seed)
+    kinds = ['double', 'int64', 'date', 'string', 'datetime']
+    data, meta = {}, {}
+    for i in range(columns):
+        kind = kinds[i % len(kinds)]
+        name = f'{kind.upper()}_{i}'
+        if kind == 'double':
+            values = rng.normal(100, 10, rows).round(4)
+        elif kind == 'int64':
+            values = rng.integers(0, 10 ** 6, rows)
+        elif kind == 'date':
+            values = (np.datetime64('2015-01-01') + rng.integers(0, 3000, rows)).astype(str)
+        elif kind == 'datetime':
+            values = (np.datetime64('2024-01-01T10:00:00') + rng.integers(0, 10 ** 6, rows)).astype(str)
+            values = np.char.replace(values, 'T', ' ')
+        else:
+            values = np.array([f'S{x}' for x in rng.integers(0, 500, rows)])
+        data[name] = values.astype(object)
+        meta[name] = {'type': kind}
+    return pd.DataFrame(data), meta
+
+
+def _long_schedule(rows, seed):
+    '''
+    Coupons, offers and amortizations tables of one synthetic bond with rows quarterly coupons,
+    in the shape Moex._build_schedule gets them. About a third of the coupon rates are unknown,
+    every 50th coupon date has a put offer and the last tenth of the coupons amortize the bond.
+    '''
+    rng = np.random.default_rng(seed)
+    issue = pd.Timestamp('2001-01-15')
+    dates = pd.date_range(issue + pd.Timedelta(days=91), periods=rows, freq='91D')
+    rate = rng.uniform(5, 15, rows).round(2)
+    rate[rng.random(rows) < 0.3] = np.nan
+    value = (rate / 100 * 1000 * 91 / 365).round(2)
+    bond = {'isin': 'RU000SYNTH0', 'name': 'Synthetic bond', 'issuevalue': 1e9, 'faceunit': 'SUR',
+            'secid': 'RU000SYNTH0', 'primary_boardid': 'TQCB'}
+    coupons = pd.DataFrame({**bond,
+                            'coupondate': dates,
+                            'recorddate': dates - pd.Timedelta(days=1),
+                            'startdate': dates - pd.Timedelta(days=91),
+                            'initialfacevalue': 1000.0,
+                            'facevalue': 1000.0,
+                            'value': value,
+                            'valueprc': rate,
+                            'value_rub': value})
+    put = dates[::50]
+    offers = pd.DataFrame({**bond,
+                           'offerdate': put,
+                           'offerdatestart': put - pd.Timedelta(days=14),
+                           'offerdateend': put - pd.Timedelta(days=7),
+                           'facevalue': 1000.0,
+                           'offerprice': 100.0,
+                           'value': 1000.0,
+                           'agent': 'Synthetic agent',
+                           'offertype': np.where(np.arange(len(put)) % 5 == 4, 'Оферта отменена', 'Оферта')})
+    repaid = dates[-max(rows // 10, 1):]
+    share = 100.0 / len(repaid)
+    amortizations = pd.DataFrame({**bond,
+                                  'amortdate': repaid,
+                                  'facevalue': 1000.0,
+                                  'initialfacevalue': 1000.0,
+                                  'valueprc': share,
+                                  'value': 10 * share,
+                                  'value_rub': 10 * share,
+                                  'data_source': 'amortization'})
+    return coupons, offers, amortizations, issue
+
+
+# every case gets (emulator, config) and returns a callable to time and the number of rows it produces
+
+def case_get_price(emulator, config):
+    tickers = _tickers(emulator, config['tickers'])
+
+    def run():
+        security_cache.invalidate()
+        return len([Moex(ticker).get_price() for ticker in tickers])
+    return run
+
+
+def case_get_prices(emulator, config):
+    tickers = _tickers(emulator, config['tickers'])
+
+    def run():
+        security_cache.invalidate()
+        return len(Moex.get_prices(tickers))
+    return run
+
+
+def case_get_bond_schedule(emulator, config):
+    bonds = [t for t in _tickers(emulator, len(emulator.shares) + config['schedules'])
+             if t not in emulator.shares.index]
+
+    def run():
+        security_cache.invalidate()
+        return sum(len(Moex(bond).get_bond_schedule()) for bond in bonds)
+    return run
+
+
+def case_build_schedule(emulator, config):
+    tables = _long_schedule(config['schedule_rows'], config['seed'])
+
+    def run():
+        coupons, offers, amortizations, issue = tables
+        # _build_schedule changes its tables in place
+        return len(Moex._build_schedule(coupons.copy(), offers.copy(), amortizations.copy(), issue))
+    return run
+
+
+def case_get_bonds_list(emulator, config):
+    return lambda: len(Moex.get_bonds_list())
+
+
+def case_get_candles(emulator, config):
+    date_to = emulator.today
+    date_from = date_to - pd.DateOffset(years=config['years'])
+    ticker = emulator.shares.index[0]
+
+    def run():
+        return len(Moex(ticker).get_candles(date_from=date_from.date(), date_to=date_to.date(),
+                                            interval=config['interval']))
+    return run
+
+
+def case_make_new_types(emulator, config):
+    df, meta = _wide_table(config['rows'], config['columns'], config['seed'])
+    return lambda: len(mfunc.make_new_types(df, meta))
+
+
+def case_calculate_zyield(emulator, config):
+    params = Moex.get_zcurve_params()
+    p = pd.Series(params.iloc[0], index=params.columns)
+    t = np.linspace(0.1, 30, config['grid'])
+    return lambda: len(Moex.calculate_zyield(p, t))
+
+
+cases = {'get_price': case_get_price,
+         'get_prices': case_get_prices,
+         'get_bond_schedule': case_get_bond_schedule,
+         'build_schedule': case_build_schedule,
+         'get_bonds_list': case_get_bonds_list,
+         'get_candles': case_get_candles,
+         'make_new_types': case_make_new_types,
+         'calculate_zyield': case_calculate_zyield}
+
+
+def measure(run, emulator, repeat: int = 3):
+    '''
+    Times run() repeat times, then runs it once more under tracemalloc for the peak
+    of Python allocations (tracemalloc slows code down, so it is kept out of the timings).
+    Requests are counted on the first run.
+    '''
+    times = []
+    requests = 0
+    rows = 0
+    for i in range(repeat):
+        before = emulator.requests
+        start = time.perf_counter()
+        rows = run()
+        times.append(time.perf_counter() - start)
+        if i == 0:
+            requests = emulator.requests - before
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'wall': min(times),
+            'wall_median': statistics.median(times),
+            'requests': requests,
+            'peak_mb': round(peak / 1024 ** 2, 3),
+            'rows': rows}
+
+
+def run_benchmarks(names=None, **config):
+    '''
+    Runs benchmark cases against an in-process iss_emulator and returns
+    {'config': ..., 'results': {case: {wall, wall_median, requests, peak_mb, rows}}}.
+    Config keys are those of default_config.
+    '''
+    config = {**default_config, **config}
+    emulator = iss_emulator.IssEmulator(shares=[f'SH{i:04d}' for i in range(max(config['tickers'], 1))],
+                                        bonds=config['bonds'],
+                                        seed=config['seed'],
+                                        latency=config['latency'])
+    iss_emulator.install(emulator, backoff=0)
+    results = {}
+    try:
+        for name in names or list(cases):
+            run = cases[name](emulator, config)
+            results[name] = measure(run, emulator, config['repeat'])
+    finally:
+        iss_emulator.uninstall()
+        security_cache.invalidate()
+    return {'config': config, 'results': results}
+
+
+def compare(results: dict, baseline: dict, tolerance: float = 0.1):
+    '''
+    Compares results with a baseline from an earlier run.
+    Returns a DataFrame of both values and their ratios per case and metric; a metric
+    regresses when it grows by more than tolerance (requests must not grow at all).
+    '''
+    rows = []
+    for name, current in results['results'].items():
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        for metric in ['wall', 'requests', 'peak_mb']:
+            ratio = current[metric] / before[metric] if before[metric] else np.nan
+            limit = 0 if metric == 'requests' else tolerance
+            rows.append({'case': name,
+                         'metric': metric,
+                         'baseline': before[metric],
+                         'current': current[metric],
+                         'ratio': ratio,
+                         'regression': bool(current[metric] > before[metric] * (1 + limit))})
+    return pd.DataFrame(rows, columns=['case', 'metric', 'baseline', 'current', 'ratio', 'regression'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks of Moex hot paths against a local ISS emulator')
+    parser.add_argument('cases', nargs='*', help='cases to run, all by default: ' + ', '.join(cases))
+    for key, value in default_config.items():
+        parser.add_argument('--' + key, type=type(value), default=value)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    args = vars(parser.parse_args(argv))
+    names, output, baseline, tolerance = (args.pop(k) for k in ['cases', 'output', 'baseline', 'tolerance'])
+    unknown = set(names) - set(cases)
+    if unknown:
+        parser.error('unknown cases: ' + ', '.join(sorted(unknown)))
+    results = run_benchmarks(names, **args)
+    table = pd.DataFrame(results['results']).T
+    print(table.to_string())
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if baseline:
+        with open(baseline, 'r') as f:
+            diff = compare(results, json.load(f), tolerance)
+        print(diff.to_string(index=False))
+        if diff['regression'].any():
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,150 @@
+import numpy as np
+import pandas as pd
+
+from zcurve import ZCurve
+
+
+def cashflow_matrix(schedule: pd.DataFrame, settle_date=None):
+    '''
+    Pads future cash flows of many bonds into matrices.
+    schedule is a long table from BondUniverse.cashflows or concatenated Moex.get_bond_schedule results.
+    Returns (secids, times in years from settlement, amounts), matrices are (bonds, max number of flows)
+    with zero amounts in the padding.
+    '''
+    settle = pd.Timestamp('today').normalize() if settle_date is None else pd.Timestamp(settle_date)
+    flows = schedule.loc[(schedule['date'] > settle) & (schedule['operationtype'] != 'issue')]
+    flows = flows.sort_values(by=['secid', 'date'], kind='stable')
+    amount = flows['couponvalue'].fillna(0).to_numpy(dtype='float64') + \
+        flows['redemptionvalue'].fillna(0).to_numpy(dtype='float64')
+    codes, secids = pd.factorize(flows['secid'])
+    pos = flows.groupby('secid', sort=False).cumcount().to_numpy()
+    width = pos.max() + 1 if len(pos) else 0
+    times = np.zeros((len(secids), width))
+    amounts = np.zeros((len(secids), width))
+    times[codes, pos] = (flows['date'] - settle).dt.days.to_numpy() / 365
+    amounts[codes, pos] = amount
+    return pd.Index(secids, name='secid'), times, amounts
+
+
+def accrued_interest(schedule: pd.DataFrame, settle_date=None):
+    '''Returns accrued coupon interest by secid on the settlement date'''
+    settle = pd.Timestamp('today').normalize() if settle_date is None else pd.Timestamp(settle_date)
+    periods = schedule.loc[schedule['operationtype'].isin(['issue', 'coupon'])]
+    periods = periods.sort_values(by=['secid', 'date'], kind='stable')
+    start = periods.groupby('secid', sort=False)['date'].shift()
+    current = periods.loc[(periods['date'] > settle) & (start <= settle)]
+    current = current.loc[~current['secid'].duplicated()]
+    start = start.loc[current.index]
+    ai = current['couponvalue'].fillna(0) * (settle - start).dt.days / (current['date'] - start).dt.days
+    return pd.Series(ai.values, index=pd.Index(current['secid'].values, name='secid'))
+
+
+def _present_value(y, times, amounts):
+    v = (1 + y[:, None]) ** -times
+    pv = np.sum(amounts * v, axis=1)
+    dpv = np.sum(-times * amounts * v, axis=1) / (1 + y)
+    return pv, dpv
+
+
+def solve_ytm(times, amounts, dirty, guess: float = 0.1, tol: float = 1e-10, max_iter: int = 50):
+    '''
+    Solves sum(amounts / (1 + y) ** times) = dirty for every row at once.
+    Newton steps are used while they stay inside the bracket, rows that do not converge
+    fall back to vectorized bisection. Returns annual effective yields as fractions.
+    '''
+    n = len(dirty)
+    lo = np.full(n, -0.99)
+    hi = np.full(n, 10.0)
+    y = np.full(n, guess)
+    done = np.zeros(n, dtype=bool)
+    for _ in range(max_iter):
+        pv, dpv = _present_value(y, times, amounts)
+        f = pv - dirty
+        # present value decreases in y, so the root is above y when f > 0
+        lo = np.where(f > 0, np.maximum(lo, y), lo)
+        hi = np.where(f < 0, np.minimum(hi, y), hi)
+        step = np.where(dpv != 0, f / np.where(dpv != 0, dpv, 1), 0)
+        new = y - step
+        outside = (new <= lo) | (new >= hi) | ~np.isfinite(new)
+        new = np.where(outside, (lo + hi) / 2, new)
+        done = done | (np.abs(new - y) < tol)
+        y = np.where(done, y, new)
+        if done.all():
+            break
+    for _ in range(200):
+        if done.all():
+            break
+        mid = (lo + hi) / 2
+        pv, _ = _present_value(mid, times, amounts)
+        f = pv - dirty
+        lo = np.where(~done & (f > 0), mid, lo)
+        hi = np.where(~done & (f <= 0), mid, hi)
+        y = np.where(done, y, mid)
+        done = done | (hi - lo < tol)
+    pv, _ = _present_value(y, times, amounts)
+    ok = done & np.isfinite(dirty) & (np.abs(pv - dirty) <= 1e-6 * np.abs(dirty))
+    return np.where(ok, y, np.nan)
+
+
+def bond_analytics(schedule: pd.DataFrame, prices, settle_date=None, accrued=None, zcurve_params=None):
+    '''
+    Yield, duration, convexity and G-spread for many bonds at once.
+    - schedule: long schedule table (see cashflow_matrix)
+    - prices: clean prices in % of face value by secid, e.g. Moex.get_prices(...)['PRICE']
+    - accrued: accrued interest by secid, e.g. ACCRUEDINT from market data. Computed from the schedule if None
+    - zcurve_params: curve params table for G-spreads, e.g. Moex.get_zcurve_params_history()
+    Returns a DataFrame indexed by secid with ytm (%), duration (years and days),
+    modified duration, convexity and gspreadbp.
+    '''
+    settle = pd.Timestamp('today').normalize() if settle_date is None else pd.Timestamp(settle_date)
+    secids, times, amounts = cashflow_matrix(schedule, settle)
+    prices = pd.Series(prices).reindex(secids).to_numpy(dtype='float64')
+    if accrued is None:
+        accrued = accrued_interest(schedule, settle)
+    accrued = pd.Series(accrued).reindex(secids).fillna(0).to_numpy(dtype='float64')
+    future = schedule.loc[(schedule['date'] > settle) & (schedule['operationtype'] != 'issue')]
+    face = future.groupby('secid')['facevalue'].first().reindex(secids).to_numpy(dtype='float64')
+    dirty = prices / 100 * face + accrued
+    y = solve_ytm(times, amounts, dirty)
+    v = (1 + y[:, None]) ** -times
+    pv = np.sum(amounts * v, axis=1)
+    duration = np.sum(times * amounts * v, axis=1) / pv
+    convexity = np.sum(times * (times + 1) * amounts * v, axis=1) / pv / (1 + y) ** 2
+    df = pd.DataFrame({'price': prices,
+                       'accruedint': accrued,
+                       'facevalue': face,
+                       'dirtyprice': dirty,
+                       'ytm': y * 100,
+                       'duration': duration,
+                       'durationdays': duration * 365,
+                       'modduration': duration / (1 + y),
+                       'convexity': convexity}, index=secids)
+    if zcurve_params is not None:
+        curve = ZCurve(zcurve_params)
+        ok = np.isfinite(duration) & (duration > 0)
+        g = np.full(len(df), np.nan)
+        if ok.any():
+            g[ok] = curve.yields(duration[ok], dates=np.repeat(settle.to_datetime64(), ok.sum()), grid=False)
+        df['zyield'] = g
+        df['gspreadbp'] = (df['ytm'] - df['zyield']) * 100
+    return df
+
+
+def compare_with_moex(analytics: pd.DataFrame, bonds_list: pd.DataFrame):
+    '''
+    Puts computed values next to EFFECTIVEYIELD, DURATION (days) and GSPREADBP
+    from Moex.get_bonds_list and returns them with their differences.
+    '''
+    moex = bonds_list.drop_duplicates(subset='SECID').set_index('SECID')
+    moex = moex.reindex(columns=['EFFECTIVEYIELD', 'DURATION', 'GSPREADBP']).reindex(analytics.index)
+    df = pd.DataFrame({'ytm': analytics['ytm'],
+                       'EFFECTIVEYIELD': moex['EFFECTIVEYIELD'],
+                       'durationdays': analytics['durationdays'],
+                       'DURATION': moex['DURATION']}, index=analytics.index)
+    df['ytm_diff'] = df['ytm'] - df['EFFECTIVEYIELD']
+    df['duration_diff'] = df['durationdays'] - df['DURATION']
+    if 'gspreadbp' in analytics.columns:
+        df['gspreadbp'] = analytics['gspreadbp']
+        df['GSPREADBP'] = moex['GSPREADBP']
+        df['gspread_diff'] = df['gspreadbp'] - df['GSPREADBP']
+    return df
@@ -0,0 +1,144 @@
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+
+from url_reader import loop_processed
+from moex_reader import Moex, urls, schedule_backfill_order, schedule_order
+
+
+class BondUniverse:
+    '''
+    Coupon, offer and amortization schedules for many bonds at once.
+    Tables are downloaded from the paginated bondization listing (all bonds per page)
+    instead of one bondization request per ticker, and all schedules are built in one
+    vectorized pass with the same rules as Moex.get_bond_schedule.
+
+    Example:
+        universe = BondUniverse()
+        universe.load()
+        cashflows = universe.cashflows(till_offer=True)
+    '''
+
+    tables = ['coupons', 'offers', 'amortizations']
+
+    def __init__(self, secids=None, date_from: str = None, date_to: str = None):
+        '''
+        - secids (list, optional): bonds to keep. Defaults to all bonds from Moex.get_bonds_list()
+        - date_from, date_to (str, optional): payment date range of the listing
+        '''
+        self.secids = secids
+        self.date_from = date_from
+        self.date_to = date_to
+        self.coupons = None
+        self.offers = None
+        self.amortizations = None
+
+    def load(self):
+        '''Downloads coupons, offers and amortizations for the whole universe'''
+        if self.secids is None:
+            self.secids = Moex.get_bonds_list()['SECID'].unique().tolist()
+        for table in self.tables:
+            df = loop_processed(urls['bondization_list'] + '.json',
+                                table=table,
+                                meta='on',
+                                limit=100,
+                                date_from=self.date_from,
+                                date_to=self.date_to)
+            df = df.loc[df['secid'].isin(self.secids)].reset_index(drop=True)
+            setattr(self, table, df)
+        self.offers = self.offers.rename(columns={'price': 'offerprice'})
+        self.offers.fillna({'offerprice': 100}, inplace=True)
+        return self
+
+    def cashflows(self, till_offer: bool = False, last_coupon: bool = False):
+        '''Returns one long schedule table for all bonds sorted by secid and date'''
+        if self.coupons is None:
+            self.load()
+        return build_schedules(self.coupons.copy(), self.offers.copy(), self.amortizations.copy(),
+                               till_offer=till_offer, last_coupon=last_coupon)
+
+
+def build_schedules(coupons, offers, amortization, issue_dates=None,
+                    till_offer: bool = False, last_coupon: bool = False):
+    '''
+    Vectorized counterpart of Moex._build_schedule for tables holding many bonds.
+    - issue_dates (pd.Series, optional): issue date by secid. Defaults to the start
+      date of the first coupon period of every bond.
+    '''
+    # same fix for missing coupon rates as in Moex.get_coupons
+    fix = coupons['valueprc'].isnull() & coupons['value'].notnull()
+    days = (coupons['coupondate'] - coupons['startdate']).dt.days
+    coupons['valueprc'] = coupons['valueprc'].mask(fix, (coupons['value'] / coupons['facevalue'] * (365 / days)).round(4) * 100)
+    if issue_dates is None:
+        issue_dates = coupons.groupby('secid')['startdate'].min()
+    # coupons processing
+    coupons.drop(columns={'issuevalue', 'primary_boardid',
+                          'recorddate', 'startdate', 'value_rub'}, inplace=True, errors='ignore')
+    coupons.rename(columns={'coupondate': 'date',
+                            'valueprc': 'couponprc',
+                            'value': 'couponvalue'}, inplace=True)
+    coupons['operationtype'] = 'coupon'
+    # offers processing
+    offers = offers.loc[~offers['offertype'].str.contains('отмен')].reset_index(drop=True)
+    offers.drop(columns={'issuevalue', 'offerdatestart', 'offerdate', 'primary_boardid',
+                'agent', 'offertype', 'value'}, inplace=True, errors='ignore')
+    offers.rename(columns={'offerdateend': 'date'}, inplace=True)
+    offers['operationtype'] = 'offer'
+    # amortization processing, the last payment of every bond is its maturity
+    amortization.drop(columns={
+        'issuevalue', 'primary_boardid', 'value_rub'}, inplace=True, errors='ignore')
+    amortization.rename(columns={'amortdate': 'date',
+                                 'data_source': 'operationtype',
+                                 'valueprc': 'redemptionprc',
+                                 'value': 'redemptionvalue'}, inplace=True)
+    amortization = amortization.sort_values(by=['secid', 'date'], kind='stable').reset_index(drop=True)
+    last = ~amortization['secid'].duplicated(keep='last') & (amortization['operationtype'] == 'amortization')
+    amortization.loc[last, 'operationtype'] = 'maturity'
+    issue = pd.DataFrame({'secid': issue_dates.index,
+                          'date': issue_dates.values,
+                          'operationtype': 'issue'})
+    df = pd.concat([coupons, offers, amortization, issue], ignore_index=True)
+    df = df.loc[df['secid'].isin(issue['secid'])].reset_index(drop=True)
+    # coupon rates are backfilled in (date, coupon - last) order within every bond
+    keys = pd.DataFrame({'secid': df['secid'],
+                         'date': df['date'],
+                         'order': df['operationtype'].map(schedule_backfill_order)})
+    backfill_index = keys.sort_values(by=['secid', 'date', 'order'], kind='stable').index
+    df['couponprc'] = df.loc[backfill_index].groupby('secid', sort=False)['couponprc'].bfill()
+    keys['order'] = df['operationtype'].map(schedule_order)
+    df = df.loc[keys.sort_values(by=['secid', 'date', 'order'], kind='stable').index].reset_index(drop=True)
+    groups = df.groupby('secid', sort=False)
+    for column in ['isin', 'name', 'initialfacevalue', 'faceunit']:
+        df[column] = df[column].fillna(groups[column].transform('first'))
+    first = ~df['secid'].duplicated()
+    # face value after each row is the initial one less all previous amortization payments
+    redemption = pd.Series(np.where(df['operationtype'] == 'amortization',
+                                    df['redemptionvalue'].to_numpy(dtype='float64'), 0.0), index=df.index)
+    paid = redemption.groupby(df['secid'], sort=False).cumsum() - redemption
+    df['facevalue'] = df['initialfacevalue'] - paid
+    df.loc[first, 'couponvalue'] = 0
+    if last_coupon:
+        df['couponprc'] = groups['couponprc'].ffill()
+    # calculating coupon values as (days from previous coupon date to current date) * (coupon rate) * (face value)
+    days = (df['date'] - groups['date'].shift()).dt.days
+    df['couponvalue'] = df['couponvalue'].fillna(days / 365 * df['couponprc'] / 100 * df['facevalue'])
+    df['couponvalue'] = round(df['couponvalue'], 2)
+    offer = df['operationtype'] == 'offer'
+    if till_offer:
+        # setting coupon and redemption values to 0 after the next offer date
+        future = offer & (df['date'] >= dt.datetime.now())
+        seen = future.astype('int64').groupby(df['secid'], sort=False).cumsum()
+        next_offer = future & (seen == 1)
+        after = (next_offer.astype('int64').groupby(df['secid'], sort=False).cumsum() > 0) & ~next_offer
+        has_offer = seen.groupby(df['secid'], sort=False).transform('max') > 0
+        df.loc[next_offer, 'redemptionvalue'] = df.loc[next_offer, 'offerprice'] / 100 * df.loc[next_offer, 'facevalue']
+        df.loc[after, ['couponvalue', 'redemptionvalue']] = 0
+        df.loc[offer & ~future & has_offer, ['couponvalue', 'redemptionvalue']] = 0
+    else:
+        df.loc[offer, ['couponvalue', 'redemptionvalue']] = 0
+    df['couponvalue'] = df['couponvalue'].where(df['couponprc'].notnull())
+    df.fillna({'redemptionvalue': 0}, inplace=True)
+    df.fillna({'offerprice': 0}, inplace=True)
+    df.fillna({'redemptionprc': 0}, inplace=True)
+    return df
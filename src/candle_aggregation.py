@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+
+# ISS candle intervals from the finest to the coarsest: minutes 1, 10, 60,
+# then day (24), week (7), month (31) and quarter (4)
+interval_order = [1, 10, 60, 24, 7, 31, 4]
+# intervals whose bars start and end at midnight
+daily_intervals = {24, 7, 31, 4}
+
+
+def can_derive(base: int, interval: int):
+    '''True when bars of interval can be built from bars of base'''
+    return base in interval_order and interval in interval_order and \
+        interval_order.index(base) < interval_order.index(interval)
+
+
+def period_keys(begin, interval: int):
+    '''
+    Integer key of the interval bar every begin timestamp falls into:
+    minutes are counted from midnight, weeks start on Monday.
+    '''
+    begin = np.asarray(begin, dtype='datetime64[ns]')
+    if interval in (1, 10, 60):
+        return begin.astype('datetime64[m]').astype('int64') // interval
+    days = begin.astype('datetime64[D]').astype('int64')
+    if interval == 24:
+        return days
+    if interval == 7:
+        # 1970-01-01 was a Thursday
+        return (days + 3) // 7
+    months = begin.astype('datetime64[M]').astype('int64')
+    return months if interval == 31 else months // 3
+
+
+def _column(df, name, dtype):
+    return df[name].to_numpy(dtype=dtype, na_value=0 if dtype == 'int64' else np.nan)
+
+
+def aggregate_candles(df: pd.DataFrame, interval: int):
+    '''
+    Builds interval bars out of finer ISS candles (open, close, high, low, value, volume,
+    begin, end columns, any subset with begin) with group-boundary reductions.
+    Bars follow the sessions present in the data: intraday bars end with their last base
+    bar, day, week, month and quarter bars run from the first to the last trading day
+    of the period (00:00:00 to 23:59:59) as ISS candles do.
+    '''
+    if len(df) == 0:
+        return df.iloc[:0].copy()
+    if not df['begin'].is_monotonic_increasing:
+        df = df.sort_values(by='begin', kind='stable')
+    begin = df['begin'].to_numpy(dtype='datetime64[ns]')
+    keys = period_keys(begin, interval)
+    starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+    ends = np.append(starts[1:], len(keys)) - 1
+    result = {}
+    for column in df.columns:
+        if column == 'open':
+            values = df[column].to_numpy()[starts]
+        elif column == 'close':
+            values = df[column].to_numpy()[ends]
+        elif column == 'high':
+            values = np.fmax.reduceat(_column(df, column, 'float64'), starts)
+        elif column == 'low':
+            values = np.fmin.reduceat(_column(df, column, 'float64'), starts)
+        elif column in ('value', 'volume'):
+            dtype = 'int64' if pd.api.types.is_integer_dtype(df[column].dtype) else 'float64'
+            values = np.add.reduceat(_column(df, column, dtype), starts)
+        elif column == 'begin':
+            values = begin[starts]
+            if interval in daily_intervals:
+                values = values.astype('datetime64[D]').astype('datetime64[ns]')
+        elif column == 'end':
+            if interval in daily_intervals:
+                values = (begin[ends].astype('datetime64[D]').astype('datetime64[ns]')
+                          + np.timedelta64(86399, 's'))
+            else:
+                values = df[column].to_numpy(dtype='datetime64[ns]')[ends]
+        else:
+            values = df[column].to_numpy()[ends]
+        result[column] = values
+    return pd.DataFrame(result, columns=df.columns).astype({c: df[c].dtype for c in ['value', 'volume']
+                                                            if c in df.columns})
@@ -0,0 +1,102 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+import zcurve
+
+
+class CurveArchive:
+    '''
+    Local archive of daily G-curve parameters (tradedate, b0, b1, b2, t1, g1-g9) kept
+    sorted by trade date, so lookups as of any date are a binary search.
+    Moex.sync_zcurve adds new trade dates to it, see Moex.zcurve_archive.
+    - path: file to keep the archive in between sessions, None keeps it in memory only
+    - format: 'pickle' (no extra dependencies) or 'parquet' (needs pyarrow)
+
+    Example:
+        Moex.zcurve_archive = CurveArchive('zcyc.pkl')
+        Moex.sync_zcurve()
+        yields = Moex.zcurve_archive.yields([1, 5, 10], dates=pd.bdate_range('2020-01-01', '2024-01-01'))
+    '''
+
+    def __init__(self, path: str = None, format: str = 'pickle'):
+        self.path = path
+        self.format = format
+        self._lock = threading.Lock()
+        # day of the last Moex.sync_zcurve
+        self.synced = None
+        self._set(None)
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    def _set(self, params):
+        self.params = params
+        if params is None:
+            self.dates = np.array([], dtype='datetime64[ns]')
+        else:
+            self.dates = params['tradedate'].to_numpy(dtype='datetime64[ns]')
+        self._curve = None
+
+    def load(self):
+        if self.format == 'parquet':
+            params = pd.read_parquet(self.path)
+        else:
+            params = pd.read_pickle(self.path)
+        self._set(params)
+
+    def save(self):
+        if self.path is None or self.params is None:
+            return
+        if self.format == 'parquet':
+            self.params.to_parquet(self.path)
+        else:
+            self.params.to_pickle(self.path)
+
+    def __len__(self):
+        return len(self.dates)
+
+    @property
+    def last_date(self):
+        '''Last trade date in the archive or None'''
+        return pd.Timestamp(self.dates[-1]) if len(self.dates) else None
+
+    def update(self, params: pd.DataFrame):
+        '''
+        Merges rows into the archive, a row replaces a stored one with the same trade date.
+        Returns the number of trade dates added.
+        '''
+        params = params.copy()
+        params['tradedate'] = pd.to_datetime(params['tradedate']).dt.normalize()
+        with self._lock:
+            before = len(self.dates)
+            frames = [params] if self.params is None else [self.params, params]
+            merged = pd.concat(frames, ignore_index=True)
+            merged = merged.drop_duplicates(subset=['tradedate'], keep='last')
+            merged = merged.sort_values(by='tradedate', kind='stable').reset_index(drop=True)
+            self._set(merged)
+            self.save()
+        return len(self.dates) - before
+
+    def rows(self, dates):
+        '''Row numbers of the params in effect on dates (the nearest trade date not after them), -1 before the archive'''
+        dates = pd.to_datetime(np.atleast_1d(dates)).values.astype('datetime64[ns]')
+        return np.searchsorted(self.dates, dates, side='right') - 1
+
+    def asof(self, date):
+        '''Returns the params of the nearest trade date not after date as a one-row DataFrame, None before the archive'''
+        row = self.rows(date)[0]
+        if row < 0:
+            return None
+        return self.params.iloc[[row]].reset_index(drop=True)
+
+    def curve(self):
+        '''zcurve.ZCurve over the whole archive'''
+        if self._curve is None:
+            self._curve = zcurve.ZCurve(self.params)
+        return self._curve
+
+    def yields(self, maturities, dates=None, grid: bool = True):
+        '''Zero-coupon yields in % as of dates (all archived dates by default), see zcurve.ZCurve.evaluate'''
+        return self.curve().yields(maturities, dates, grid)
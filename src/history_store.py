@@ -0,0 +1,142 @@
+import os
+import json
+import threading
+import datetime as dt
+
+import pandas as pd
+
+
+def _to_date(x):
+    return pd.to_datetime(x).date()
+
+
+def merge_ranges(ranges):
+    '''Merges overlapping and adjacent [from, to] date ranges'''
+    merged = []
+    for a, b in sorted(ranges):
+        if merged and a <= merged[-1][1] + dt.timedelta(days=1):
+            merged[-1][1] = max(merged[-1][1], b)
+        else:
+            merged.append([a, b])
+    return merged
+
+
+def missing_ranges(covered, date_from, date_to):
+    '''Returns the parts of [date_from, date_to] not covered by merged ranges'''
+    gaps = []
+    start = date_from
+    for a, b in covered:
+        if b < start:
+            continue
+        if a > date_to:
+            break
+        if a > start:
+            gaps.append((start, a - dt.timedelta(days=1)))
+        start = max(start, b + dt.timedelta(days=1))
+    if start <= date_to:
+        gaps.append((start, date_to))
+    return gaps
+
+
+class HistoryStore:
+    '''
+    Local store of daily history and candles partitioned as <directory>/<ticker>/<board>/<interval>.
+    Every partition keeps its data and the list of date ranges already downloaded, so
+    only the missing gaps are requested from ISS. Today is never marked as downloaded
+    because the current session is still changing.
+    - format: 'pickle' (no extra dependencies) or 'parquet' (needs pyarrow)
+    '''
+
+    def __init__(self, directory: str, format: str = 'pickle'):
+        self.directory = directory
+        self.format = format
+        # guards _locks, the (ticker, board, interval) -> lock map
+        self._lock = threading.Lock()
+        self._locks = {}
+
+    def _partition_lock(self, ticker, board, interval):
+        '''Lock of one partition, held only while the partition files are read or written'''
+        key = (str(ticker), str(board), str(interval))
+        with self._lock:
+            if key not in self._locks:
+                self._locks[key] = threading.Lock()
+            return self._locks[key]
+
+    def _path(self, ticker, board, interval):
+        return os.path.join(self.directory, str(ticker), str(board), str(interval))
+
+    def ranges(self, ticker, board, interval):
+        '''Returns the list of downloaded [from, to] ranges of a partition without loading its data'''
+        try:
+            with open(self._path(ticker, board, interval) + '.json', 'r') as f:
+                return [[_to_date(a), _to_date(b)] for a, b in json.load(f)]
+        except (OSError, ValueError):
+            return []
+
+    def covers(self, ticker, board, interval, date_from, date_to):
+        '''True when [date_from, date_to] has been downloaded completely'''
+        covered = self.ranges(ticker, board, interval)
+        return bool(covered) and not missing_ranges(covered, _to_date(date_from), _to_date(date_to))
+
+    def load(self, ticker, board, interval):
+        '''Returns (DataFrame or None, list of downloaded [from, to] ranges)'''
+        path = self._path(ticker, board, interval)
+        covered = self.ranges(ticker, board, interval)
+        if not covered:
+            return None, []
+        if self.format == 'parquet':
+            df = pd.read_parquet(path + '.parquet')
+        else:
+            df = pd.read_pickle(path + '.pkl')
+        return df, covered
+
+    def save(self, ticker, board, interval, df, covered):
+        path = self._path(ticker, board, interval)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if self.format == 'parquet':
+            df.to_parquet(path + '.parquet')
+        else:
+            df.to_pickle(path + '.pkl')
+        with open(path + '.json', 'w') as f:
+            json.dump([[a.isoformat(), b.isoformat()] for a, b in covered], f)
+
+    def read(self, ticker, board, interval, date_from, date_to, fetch, date_col: str):
+        '''
+        Returns rows of a partition between date_from and date_to (inclusive).
+        fetch(date_from, date_to) is called for every missing gap and its result is merged in.
+        Ranges the result lists in attrs['failed_ranges'] stay missing and are fetched next time.
+        '''
+        date_from, date_to = _to_date(date_from), _to_date(date_to)
+        lock = self._partition_lock(ticker, board, interval)
+        with lock:
+            df, covered = self.load(ticker, board, interval)
+        gaps = missing_ranges(covered, date_from, date_to)
+        if gaps:
+            # network I/O runs outside the lock, other partitions and readers are not held up
+            fetched = [fetch(a, b) for a, b in gaps]
+            today = dt.date.today()
+            failed = merge_ranges([[_to_date(a), _to_date(b)] for x in fetched
+                                   for a, b, *_ in x.attrs.get('failed_ranges', [])])
+            done = [[x, min(y, today - dt.timedelta(days=1))] for a, b in gaps
+                    for x, y in missing_ranges(failed, a, b) if x < today]
+            with lock:
+                # the partition may have been written by another thread in the meantime
+                df, covered = self.load(ticker, board, interval)
+                frames = ([] if df is None else [df]) + fetched
+                data = [x for x in frames if len(x) > 0]
+                if data:
+                    df = pd.concat(data, ignore_index=True)
+                    df = df.drop_duplicates(subset=[date_col], keep='last')
+                    df = df.sort_values(by=date_col).reset_index(drop=True)
+                else:
+                    df = frames[0]
+                covered = merge_ranges(covered + done)
+                self.save(ticker, board, interval, df, covered)
+        dates = df[date_col].dt.normalize()
+        mask = (dates >= pd.Timestamp(date_from)) & (dates <= pd.Timestamp(date_to))
+        return df.loc[mask].reset_index(drop=True)
+
+    def last_date(self, ticker, board, interval):
+        '''Returns the end of the last downloaded range or None'''
+        _, covered = self.load(ticker, board, interval)
+        return covered[-1][1] if covered else None
@@ -0,0 +1,216 @@
+import re
+import sys
+import bisect
+import threading
+import contextvars
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import pandas as pd
+
+# callables receiving event dicts; url_reader checks this list before timing anything,
+# so with no hooks installed instrumentation costs one truth test per call
+hooks = []
+# Moex method an event is attributed to, set for work handed to other threads
+method_tag = contextvars.ContextVar('method_tag', default=None)
+# upper bounds of latency histogram buckets in seconds
+buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float('inf'))
+
+
+def add_hook(hook):
+    '''Installs a hook: a callable taking one event dict'''
+    hooks.append(hook)
+    return hook
+
+
+def remove_hook(hook):
+    if hook in hooks:
+        hooks.remove(hook)
+
+
+@contextmanager
+def instrument(hook=None):
+    '''
+    Collects events inside a with block and yields the hook (a new MetricsCollector by default).
+    Example:
+        with instrument() as metrics:
+            Moex('SBER').get_candles()
+        metrics.print_summary()
+    '''
+    hook = hook if hook is not None else MetricsCollector()
+    add_hook(hook)
+    try:
+        yield hook
+    finally:
+        remove_hook(hook)
+
+
+def endpoint(url: str):
+    '''Endpoint name of a url template: its path without the .json suffix, %(name)s written as {name}'''
+    path = re.sub(r'%\((\w+)\)s', r'{\1}', urlsplit(url).path)
+    return path[:-len('.json')] if path.endswith('.json') else path
+
+
+def caller():
+    '''Name of the outermost Moex method on the current stack'''
+    tag = method_tag.get()
+    if tag is not None:
+        return tag
+    name = None
+    frame = sys._getframe(1)
+    while frame is not None:
+        if frame.f_globals.get('__name__') == 'moex_reader' and not frame.f_code.co_name.startswith('<'):
+            name = frame.f_code.co_name
+        frame = frame.f_back
+    return name
+
+
+def bind(func):
+    '''
+    Returns func running in worker threads with the context variables of the caller
+    (the current Moex method, the host limit of an async_reader.AsyncReader).
+    func itself is returned when there is nothing to carry.
+    '''
+    context = contextvars.copy_context()
+    if not hooks and not len(context):
+        return func
+    tag = caller() if hooks else None
+
+    def wrapper(*args, **kwargs):
+        local = context.copy()
+        if tag is not None:
+            local.run(method_tag.set, tag)
+        return local.run(func, *args, **kwargs)
+    return wrapper
+
+
+def emit(kind: str, **fields):
+    '''
+    Sends an event to every hook. Event kinds and their fields:
+    - request: endpoint, url, params, status, seconds, elapsed (until response headers),
+      bytes, cache ('hit', 'revalidated', 'miss' or None), retries, error
+    - decode: endpoint, seconds, bytes
+    - convert: endpoint, seconds, rows
+    - pages: endpoint, seconds, pages, rows
+    Every event also carries kind and method (the calling Moex method or None).
+    '''
+    event = {'kind': kind, 'method': caller(), **fields}
+    for hook in list(hooks):
+        hook(event)
+
+
+class MetricsCollector:
+    '''
+    Built-in hook aggregating events by (kind, endpoint, method):
+    counts, total and maximum seconds, latency histogram, bytes, rows, cache hits,
+    retries and errors. Repeated requests for the same url and params are counted
+    in duplicates.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self.stats = defaultdict(lambda: {'count': 0, 'seconds': 0.0, 'max': 0.0,
+                                              'histogram': [0] * len(buckets), 'bytes': 0, 'rows': 0,
+                                              'cache_hits': 0, 'retries': 0, 'errors': 0, 'pages': 0})
+            self.urls = Counter()
+
+    def __call__(self, event):
+        key = (event['kind'], event.get('endpoint'), event.get('method'))
+        seconds = event.get('seconds', 0.0)
+        with self._lock:
+            stat = self.stats[key]
+            stat['count'] += 1
+            stat['seconds'] += seconds
+            stat['max'] = max(stat['max'], seconds)
+            stat['histogram'][bisect.bisect_left(buckets, seconds)] += 1
+            stat['bytes'] += event.get('bytes') or 0
+            stat['rows'] += event.get('rows') or 0
+            stat['pages'] += event.get('pages') or 0
+            stat['retries'] += event.get('retries') or 0
+            stat['cache_hits'] += event.get('cache') in ('hit', 'revalidated')
+            stat['errors'] += bool(event.get('error')) or (event.get('status') or 200) >= 400
+            if event['kind'] == 'request':
+                params = tuple(sorted((k, str(v)) for k, v in (event.get('params') or {}).items()
+                                      if v is not None))
+                self.urls[(event.get('url'), params)] += 1
+
+    @property
+    def duplicates(self):
+        '''Number of requests repeating an earlier url with the same params'''
+        return sum(count - 1 for count in self.urls.values())
+
+    def summary(self):
+        '''Returns a DataFrame with one row per (kind, endpoint, method)'''
+        with self._lock:
+            rows = [{'kind': kind, 'endpoint': endpoint, 'method': method,
+                     **{k: v for k, v in stat.items() if k != 'histogram'}}
+                    for (kind, endpoint, method), stat in self.stats.items()]
+        df = pd.DataFrame(rows, columns=['kind', 'endpoint', 'method', 'count', 'seconds', 'max', 'bytes',
+                                         'rows', 'pages', 'cache_hits', 'retries', 'errors'])
+        df['mean'] = df['seconds'] / df['count']
+        return df.sort_values(by='seconds', ascending=False).reset_index(drop=True)
+
+    def print_summary(self):
+        summary = self.summary()
+        print(summary.to_string(index=False) if len(summary) else 'no events')
+        print('duplicate requests:', self.duplicates)
+
+    def to_prometheus(self, prefix: str = 'moex'):
+        '''Returns the metrics in the Prometheus text exposition format'''
+        lines = []
+        with self._lock:
+            items = list(self.stats.items())
+        for kind in sorted({key[0] for key, _ in items}):
+            name = f'{prefix}_{kind}_seconds'
+            lines += [f'# TYPE {name} histogram']
+            for (k, endpoint, method), stat in items:
+                if k != kind:
+                    continue
+                labels = f'endpoint="{endpoint}",method="{method or ""}"'
+                total = 0
+                for bound, count in zip(buckets, stat['histogram']):
+                    total += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{name}_bucket{{{labels},le="{le}"}} {total}')
+                lines.append(f'{name}_sum{{{labels}}} {stat["seconds"]}')
+                lines.append(f'{name}_count{{{labels}}} {stat["count"]}')
+        for field in ['bytes', 'rows', 'cache_hits', 'retries', 'errors']:
+            name = f'{prefix}_{field}_total'
+            lines.append(f'# TYPE {name} counter')
+            for (kind, endpoint, method), stat in items:
+                if stat[field]:
+                    lines.append(f'{name}{{kind="{kind}",endpoint="{endpoint}",method="{method or ""}"}} '
+                                 f'{stat[field]}')
+        return '\n'.join(lines) + '\n'
+
+
+class OpenTelemetryHook:
+    '''
+    Hook recording events into OpenTelemetry instruments created from a Meter, e.g.
+    add_hook(OpenTelemetryHook(opentelemetry.metrics.get_meter('moex'))).
+    '''
+
+    def __init__(self, meter, prefix: str = 'moex'):
+        self.duration = meter.create_histogram(prefix + '.duration', unit='s')
+        self.bytes = meter.create_counter(prefix + '.bytes', unit='By')
+        self.rows = meter.create_counter(prefix + '.rows')
+        self.retries = meter.create_counter(prefix + '.retries')
+        self.cache_hits = meter.create_counter(prefix + '.cache_hits')
+
+    def __call__(self, event):
+        attributes = {'kind': event['kind'], 'endpoint': event.get('endpoint') or '',
+                      'method': event.get('method') or ''}
+        self.duration.record(event.get('seconds', 0.0), attributes)
+        if event.get('bytes'):
+            self.bytes.add(event['bytes'], attributes)
+        if event.get('rows'):
+            self.rows.add(event['rows'], attributes)
+        if event.get('retries'):
+            self.retries.add(event['retries'], attributes)
+        if event.get('cache') in ('hit', 'revalidated'):
+            self.cache_hits.add(1, attributes)
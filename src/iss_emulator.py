@@ -0,0 +1,874 @@
+import io
+import os
+import re
+import json
+import time
+import zlib
+import random
+import threading
+import datetime as dt
+from collections import Counter, OrderedDict
+from zipfile import ZipFile
+from urllib.parse import urlsplit, parse_qsl
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+import zcurve
+import url_reader
+import moex_reader
+from transport import Transport, pooled_session
+
+# first date of synthetic price paths
+epoch = pd.Timestamp('2005-01-03')
+# minutes of one synthetic trading session starting at 10:00
+session_minutes = 520
+session_start = pd.Timedelta(hours=10)
+# ISS types that cannot be told from a pandas dtype
+iss_types = {'begin': 'datetime', 'end': 'datetime', 'SYSTIME': 'datetime',
+             'UPDATETIME': 'time', 'tradetime': 'time'}
+# tenors of the zcyc yearyields table
+zcyc_periods = [0.25, 0.5, 0.75, 1, 2, 3, 5, 7, 10, 15, 20, 30]
+bond_boards = {'TQCB': 58, 'TQOB': 58}
+default_shares = ('SBER', 'GAZP', 'LKOH', 'GMKN', 'NVTK', 'ROSN', 'MGNT', 'MTSS', 'VTBR', 'ALRS')
+
+
+def _rng(*keys):
+    '''Random generator seeded by keys, the same keys always give the same numbers'''
+    return np.random.default_rng([zlib.crc32(str(k).encode()) for k in keys])
+
+
+def synthetic_shares(tickers=default_shares, seed: int = 0):
+    '''Returns a table of synthetic shares on TQBR: secid, price at the epoch, daily volatility'''
+    rng = _rng(seed, 'shares')
+    return pd.DataFrame({'secid': list(tickers),
+                         'boardid': 'TQBR',
+                         'price': rng.uniform(20, 5000, len(tickers)).round(2),
+                         'volatility': rng.uniform(0.01, 0.03, len(tickers)),
+                         'issuesize': rng.integers(10 ** 7, 10 ** 10, len(tickers))})
+
+
+def synthetic_bonds(n: int = 100, seed: int = 0, today=None):
+    '''
+    Returns a synthetic bond universe as a dict of tables:
+    - bonds: one row per bond (secid, boardid, issuedate, matdate, couponpercent, period, ...)
+    - coupons, offers, amortizations: bondization tables with ISS columns
+    About a fifth of the bonds amortize in four equal payments, some have a put offer
+    in the middle of their life and some are floaters with unknown future coupons.
+    '''
+    today = pd.Timestamp(today or dt.date.today()).normalize()
+    rng = _rng(seed, 'bonds', n)
+    secid = np.array([f'RU000S{i:06d}' for i in range(n)], dtype=object)
+    period = rng.choice([91, 182], n)
+    ncoupons = rng.integers(4, 41, n)
+    issue = today - pd.to_timedelta(rng.integers(30, 8 * 365, n), unit='D')
+    bonds = pd.DataFrame({'secid': secid,
+                          'boardid': np.where(rng.random(n) < 0.2, 'TQOB', 'TQCB'),
+                          'name': [f'Synthetic bond {i}' for i in range(n)],
+                          'issuedate': issue,
+                          'matdate': issue + pd.to_timedelta(ncoupons * period, unit='D'),
+                          'period': period,
+                          'ncoupons': ncoupons,
+                          'couponpercent': rng.uniform(5, 16, n).round(2),
+                          'facevalue': 1000.0,
+                          'issuesize': rng.integers(10 ** 5, 10 ** 7, n),
+                          'amortizing': (rng.random(n) < 0.2) & (ncoupons >= 8),
+                          'floater': rng.random(n) < 0.1,
+                          'offer': np.where((rng.random(n) < 0.15) & (ncoupons >= 6), ncoupons // 2, 0)})
+    # coupons
+    idx = np.repeat(np.arange(n), ncoupons)
+    k = np.arange(len(idx)) - np.repeat(np.cumsum(ncoupons) - ncoupons, ncoupons) + 1
+    b = bonds.iloc[idx].reset_index(drop=True)
+    coupondate = b['issuedate'] + pd.to_timedelta(k * b['period'], unit='D')
+    startdate = coupondate - pd.to_timedelta(b['period'], unit='D')
+    # amortizing bonds repay 25% on each of the last four coupon dates
+    repaid = np.where(b['amortizing'], np.clip(k - 1 - (b['ncoupons'] - 4), 0, 4), 0)
+    face = b['facevalue'] * (1 - 0.25 * repaid)
+    value = (b['couponpercent'] / 100 * face * b['period'] / 365).round(2)
+    unknown = b['floater'] & (startdate > today)
+    coupons = pd.DataFrame({'isin': b['secid'],
+                            'name': b['name'],
+                            'issuevalue': b['issuesize'] * b['facevalue'],
+                            'coupondate': coupondate,
+                            'recorddate': coupondate - pd.Timedelta(days=1),
+                            'startdate': startdate,
+                            'initialfacevalue': b['facevalue'],
+                            'facevalue': face,
+                            'faceunit': 'SUR',
+                            'value': value.mask(unknown),
+                            'valueprc': b['couponpercent'].mask(unknown),
+                            'value_rub': value.mask(unknown),
+                            'secid': b['secid'],
+                            'primary_boardid': b['boardid']})
+    # amortizations: four payments for amortizing bonds, one at maturity otherwise
+    last = coupons.loc[k > np.where(b['amortizing'], b['ncoupons'] - 4, b['ncoupons'] - 1)]
+    share = np.where(bonds.set_index('secid').loc[last['secid'], 'amortizing'], 25.0, 100.0)
+    amortizations = pd.DataFrame({'isin': last['isin'].values,
+                                  'name': last['name'].values,
+                                  'issuevalue': last['issuevalue'].values,
+                                  'amortdate': last['coupondate'].values,
+                                  'facevalue': last['facevalue'].values,
+                                  'initialfacevalue': last['initialfacevalue'].values,
+                                  'faceunit': 'SUR',
+                                  'valueprc': share,
+                                  'value': last['initialfacevalue'].values * share / 100,
+                                  'value_rub': last['initialfacevalue'].values * share / 100,
+                                  'data_source': 'amortization',
+                                  'secid': last['secid'].values,
+                                  'primary_boardid': last['primary_boardid'].values})
+    final = ~amortizations['secid'].duplicated(keep='last')
+    amortizations.loc[final, 'data_source'] = 'maturity'
+    # put offers on the coupon date in the middle of the life of a bond
+    put = coupons.loc[k == b['offer']]
+    offers = pd.DataFrame({'isin': put['isin'].values,
+                           'name': put['name'].values,
+                           'issuevalue': put['issuevalue'].values,
+                           'offerdate': put['coupondate'].values,
+                           'offerdatestart': (put['coupondate'] - pd.Timedelta(days=14)).values,
+                           'offerdateend': (put['coupondate'] - pd.Timedelta(days=7)).values,
+                           'facevalue': put['facevalue'].values,
+                           'faceunit': 'SUR',
+                           'price': 100.0,
+                           'value': put['facevalue'].values,
+                           'agent': 'Synthetic agent',
+                           'offertype': 'Оферта',
+                           'secid': put['secid'].values,
+                           'primary_boardid': put['primary_boardid'].values})
+    return {'bonds': bonds, 'coupons': coupons, 'offers': offers, 'amortizations': amortizations}
+
+
+def synthetic_zcyc_params(dates, seed: int = 0):
+    '''Returns G-curve params (ISS names: tradedate, tradetime, B1-B3, T1, G1-G9) for dates'''
+    dates = pd.DatetimeIndex(dates)
+    days = (dates - epoch).days.to_numpy()
+    wave = np.sin(days / 180)
+    g = _rng(seed, 'zcyc').normal(0, 30, 9)
+    df = pd.DataFrame({'tradedate': dates,
+                       'tradetime': '18:40:00',
+                       'B1': 800 + 150 * wave,
+                       'B2': -150 + 60 * np.cos(days / 250),
+                       'B3': 100 + 80 * wave,
+                       'T1': 2 + 0.5 * np.sin(days / 400)})
+    for i in range(9):
+        df[f'G{i + 1}'] = g[i] * np.cos(days / (100 + 30 * i))
+    return df
+
+
+class IssEmulator:
+    '''
+    Local stand-in for iss.moex.com that serves synthetic or recorded responses
+    for every url template in moex_reader.urls.
+    - shares, bonds: synthetic universe (see synthetic_shares, synthetic_bonds)
+    - latency: seconds added to every request, or a (min, max) range
+    - error_rate: share of requests answered with error_status
+    - reset_rate: share of requests whose connection is dropped
+    - fixtures: directory of recorded responses (see record_fixture) served before synthetic data
+    - today: last trading date of the synthetic data
+    History, yields, candles and the bondization listing are paginated like ISS and
+    provide <table>.cursor tables; iss.only and <table>.columns are honoured.
+    Every request is counted in requests and by path in paths.
+
+    Example:
+        emulator = install(IssEmulator(bonds=1000, latency=0.02))
+        Moex('SBER').get_candles(interval=60)
+        uninstall()
+    '''
+
+    def __init__(self, shares=default_shares, bonds: int = 100, seed: int = 0,
+                 latency=0.0, error_rate: float = 0.0, error_status: int = 503,
+                 reset_rate: float = 0.0, fixtures: str = None, today=None):
+        self.seed = seed
+        self.today = pd.Timestamp(today or dt.date.today()).normalize()
+        self.shares = synthetic_shares(shares, seed).set_index('secid', drop=False)
+        universe = synthetic_bonds(bonds, seed, self.today)
+        self.bonds = universe.pop('bonds').set_index('secid', drop=False)
+        self.bondization = universe
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.reset_rate = reset_rate
+        self.fixtures = fixtures
+        self.requests = 0
+        self.paths = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._share_paths = {}
+        # generated tables by request, pages of one listing are cut from the same table
+        self._tables = OrderedDict()
+        self.days = pd.bdate_range(epoch, self.today)
+        self.routes = [(re.compile(pattern), getattr(self, name)) for pattern, name in [
+            (r'^/securities$', '_search'),
+            (r'^/securities/(?P<ticker>[^/]+)$', '_description'),
+            (r'^/securities/(?P<ticker>[^/]+)/dividends$', '_dividends'),
+            (r'^/engines/stock/markets/bonds/securities$', '_bonds_list'),
+            (r'^/engines/stock/markets/bonds/boards$', '_boards'),
+            (r'^/engines/stock/zcyc$', '_zcyc'),
+            (r'^/engines/\w+/markets/\w+/boards/(?P<board>\w+)/securities$', '_snapshot'),
+            (r'^/engines/\w+/markets/\w+/boards/(?P<board>\w+)/securities/(?P<ticker>[^/]+)$', '_snapshot'),
+            (r'^/engines/\w+/markets/\w+/boards/\w+/securities/(?P<ticker>[^/]+)/candles$', '_candles'),
+            (r'^/history/engines/\w+/markets/\w+/boards/(?P<board>\w+)/securities$', '_board_history'),
+            (r'^/history/engines/\w+/markets/\w+/boards/(?P<board>\w+)/yields$', '_board_history_yields'),
+            (r'^/history/engines/\w+/markets/\w+/boards/\w+/securities/(?P<ticker>[^/]+)$', '_history'),
+            (r'^/history/engines/\w+/markets/\w+/boards/\w+/yields/(?P<ticker>[^/]+)$', '_history_yields'),
+            (r'^/statistics/engines/stock/markets/bonds/bondization/(?P<ticker>[^/]+)$', '_bondization'),
+            (r'^/statistics/engines/stock/markets/bonds/bondization$', '_bondization_list'),
+            (r'^/statistics/engines/stock/markets/index/analytics/(?P<ticker>[^/]+)$', '_index_analytics'),
+            (r'^/securitygroups/stock_index/collections$', '_collections'),
+            (r'^/securitygroups/stock_index/collections/(?P<ticker>[^/]+)/securities$', '_collection')]]
+
+    # request handling
+
+    def handle(self, path: str, params: dict):
+        '''Returns (status, headers, body) for a request path such as /iss/securities/SBER.json'''
+        with self._lock:
+            self.requests += 1
+            self.paths[path] += 1
+            fail = self._random.random() < self.error_rate
+            reset = self._random.random() < self.reset_rate
+        latency = self.latency
+        if isinstance(latency, (tuple, list)):
+            latency = random.uniform(*latency)
+        if latency:
+            time.sleep(latency)
+        if reset:
+            raise ConnectionResetError(path)
+        if fail:
+            return self.error_status, {'Content-Type': 'text/plain'}, b'emulated error'
+        path = path[path.find('/iss/') + len('/iss'):] if '/iss/' in path else path
+        if path == '/downloads/engines/stock/zcyc/dynamic.csv.zip':
+            return 200, {'Content-Type': 'application/zip'}, self._zcyc_archive()
+        path = re.sub(r'\.json$', '', path).rstrip('/')
+        tables, paging = self._fixture(path)
+        if tables is None:
+            for pattern, handler in self.routes:
+                m = pattern.match(path)
+                if m:
+                    tables, paging = handler(params, **m.groupdict())
+                    break
+            else:
+                return 404, {'Content-Type': 'text/plain'}, b'not found'
+        body = json.dumps(self._select(tables, paging, params), ensure_ascii=False).encode()
+        return 200, {'Content-Type': 'application/json; charset=utf-8'}, body
+
+    def _fixture(self, path):
+        if self.fixtures is None:
+            return None, None
+        try:
+            with open(os.path.join(self.fixtures, path.strip('/') + '.json'), 'rb') as f:
+                return json.load(f), None
+        except OSError:
+            return None, None
+
+    @staticmethod
+    def _select(tables, paging, params):
+        '''Applies iss.only, <table>.columns, start/limit pagination and cursors'''
+        only = params.get('iss.only')
+        only = None if only is None else only.split(',')
+        meta = params.get('iss.meta', 'on') != 'off'
+        paging = paging or {}
+        response = {}
+        for name, table in tables.items():
+            if name in paging:
+                max_limit, cursor = paging[name]
+                limit = params.get('limit')
+                limit = max_limit if limit in (None, 'unlimited') else min(int(limit), max_limit)
+                start = int(params.get('start') or 0)
+                if isinstance(table, dict):
+                    total = len(table['data'])
+                    table = dict(table, data=table['data'][start:start + limit])
+                else:
+                    total = len(table)
+                    table = table.iloc[start:start + limit]
+                if cursor and (only is None or name + '.cursor' in only):
+                    response[name + '.cursor'] = {'metadata': {'INDEX': {'type': 'int64'},
+                                                               'TOTAL': {'type': 'int64'},
+                                                               'PAGESIZE': {'type': 'int64'}},
+                                                  'columns': ['INDEX', 'TOTAL', 'PAGESIZE'],
+                                                  'data': [[start, total, limit]]}
+            if only is not None and name not in only:
+                continue
+            if not isinstance(table, dict):
+                table = _compact(table)
+            columns = params.get(name + '.columns')
+            if columns:
+                keep = [i for i, c in enumerate(table['columns']) if c in columns.split(',')]
+                table = {'metadata': {table['columns'][i]: table['metadata'].get(table['columns'][i])
+                                      for i in keep},
+                         'columns': [table['columns'][i] for i in keep],
+                         'data': [[row[i] for i in keep] for row in table['data']]}
+            if not meta:
+                table = dict(table, metadata={})
+            response[name] = table
+        return response
+
+    # synthetic prices
+
+    def _kind(self, ticker):
+        if ticker in self.shares.index:
+            return 'share'
+        if ticker in self.bonds.index:
+            return 'bond'
+        return None
+
+    def _closes(self, ticker, days):
+        '''Daily closes on trading days'''
+        if self._kind(ticker) == 'share':
+            with self._lock:
+                if ticker not in self._share_paths:
+                    share = self.shares.loc[ticker]
+                    steps = _rng(self.seed, ticker, 'daily').normal(0, share['volatility'], len(self.days))
+                    self._share_paths[ticker] = share['price'] * np.exp(np.cumsum(steps))
+                path = self._share_paths[ticker]
+            index = self.days.get_indexer(days)
+            return np.where(index >= 0, path[index], self.shares.loc[ticker, 'price'])
+        bond = self.bonds.loc[ticker]
+        t = (days - epoch).days.to_numpy()
+        phase = zlib.crc32(ticker.encode()) % 628 / 100
+        # prices oscillate around par and converge to it towards maturity
+        pull = np.clip((bond['matdate'] - days).days.to_numpy() / 365, 0, 1)
+        return 100 + pull * (3 * np.sin(t / 120 + phase) + 0.5 * np.sin(t / 17 + 2 * phase))
+
+    def _trading_days(self, ticker, date_from=None, date_to=None):
+        days = self.days
+        if self._kind(ticker) == 'bond':
+            bond = self.bonds.loc[ticker]
+            days = days[(days >= bond['issuedate']) & (days < bond['matdate'])]
+        if date_from is not None:
+            days = days[days >= pd.Timestamp(date_from).normalize()]
+        if date_to is not None:
+            days = days[days <= pd.Timestamp(date_to).normalize()]
+        return days
+
+    def _minutes(self, ticker, day, c0, c1, volatility):
+        '''Minute bars of one session as a Brownian bridge from the previous close to the close'''
+        rng = _rng(self.seed, ticker, day.toordinal())
+        sigma = volatility / np.sqrt(session_minutes) * c0
+        walk = np.cumsum(rng.standard_normal(session_minutes) * sigma)
+        k = np.arange(1, session_minutes + 1) / session_minutes
+        close = c0 + (c1 - c0) * k + walk - k * walk[-1]
+        open = np.concatenate([[c0], close[:-1]])
+        high = np.maximum(open, close) + np.abs(rng.standard_normal(session_minutes)) * sigma / 2
+        low = np.maximum(np.minimum(open, close) - np.abs(rng.standard_normal(session_minutes)) * sigma / 2,
+                         0.01)
+        decimals = 2 if self._kind(ticker) == 'share' else 4
+        volume = rng.integers(1, 300, session_minutes)
+        return (open.round(decimals), high.round(decimals), low.round(decimals),
+                close.round(decimals), volume)
+
+    def _cached(self, key, build):
+        with self._lock:
+            if key in self._tables:
+                self._tables.move_to_end(key)
+                return self._tables[key]
+        df = build()
+        with self._lock:
+            self._tables[key] = df
+            if len(self._tables) > 64:
+                self._tables.popitem(last=False)
+        return df
+
+    def _session(self, ticker, day, c0, c1, volatility, factor):
+        '''(open, close, high, low, value, volume, waprice) of one session'''
+        o, h, l, c, v = self._minutes(ticker, day, c0, c1, volatility)
+        value = (v * c * factor).sum()
+        return o[0], c[-1], h.max(), l.min(), value, v.sum(), round(value / v.sum() / factor, 4)
+
+    def candles(self, ticker, date_from=None, date_to=None, interval: int = 24):
+        '''
+        Returns synthetic candles with ISS columns. All intervals are aggregated from the same
+        minute bars, so e.g. hourly candles of a day add up to its daily candle.
+        '''
+        return self._cached(('candles', ticker, str(date_from), str(date_to), interval),
+                            lambda: self._build_candles(ticker, date_from, date_to, interval))
+
+    def _build_candles(self, ticker, date_from, date_to, interval):
+        kind = self._kind(ticker)
+        columns = ['open', 'close', 'high', 'low', 'value', 'volume', 'begin', 'end']
+        days = self._trading_days(ticker, date_from, date_to)
+        if kind is None or len(days) == 0:
+            return pd.DataFrame(columns=columns)
+        closes = self._closes(ticker, days)
+        prev = self._closes(ticker, days - pd.offsets.BDay(1))
+        volatility = self.shares.loc[ticker, 'volatility'] if kind == 'share' else 0.003
+        factor = 1 if kind == 'share' else 10
+        intraday = interval in (1, 10, 60)
+        rows = []
+        for day, c0, c1 in zip(days, prev, closes):
+            if intraday:
+                o, h, l, c, v = self._minutes(ticker, day, c0, c1, volatility)
+                starts = np.arange(0, session_minutes, interval)
+                begin = day + session_start + pd.to_timedelta(starts, unit='min')
+                lengths = np.diff(np.append(starts, session_minutes))
+                rows.append(pd.DataFrame({'open': o[starts],
+                                          'close': c[np.append(starts[1:], session_minutes) - 1],
+                                          'high': np.maximum.reduceat(h, starts),
+                                          'low': np.minimum.reduceat(l, starts),
+                                          'value': np.add.reduceat(v * c * factor, starts),
+                                          'volume': np.add.reduceat(v, starts),
+                                          'begin': begin,
+                                          'end': begin + pd.to_timedelta(lengths * 60 - 1, unit='s')}))
+            else:
+                rows.append(self._session(ticker, day, c0, c1, volatility, factor)[:6] + (day,))
+        if intraday:
+            df = pd.concat(rows, ignore_index=True)
+        else:
+            df = pd.DataFrame(rows, columns=['open', 'close', 'high', 'low', 'value', 'volume', 'begin'])
+            if interval in (7, 31, 4):
+                freq = {7: 'W', 31: 'M', 4: 'Q'}[interval]
+                period = df['begin'].dt.to_period(freq)
+                df = df.groupby(period, sort=True).agg(open=('open', 'first'), close=('close', 'last'),
+                                                       high=('high', 'max'), low=('low', 'min'),
+                                                       value=('value', 'sum'), volume=('volume', 'sum'),
+                                                       begin=('begin', 'first'), last=('begin', 'last'))
+                df = df.reset_index(drop=True).rename(columns={'last': 'end'})
+            else:
+                df['end'] = df['begin']
+            df['end'] = df['end'] + pd.Timedelta(hours=23, minutes=59, seconds=59)
+        df['value'] = df['value'].round(2)
+        return df[columns]
+
+    def _day_bars(self, ticker, date_from=None, date_to=None):
+        df = self.candles(ticker, date_from, date_to, 24)
+        factor = 1 if self._kind(ticker) == 'share' else 10
+        return pd.DataFrame({'TRADEDATE': pd.to_datetime(df['begin']).dt.normalize(),
+                             'OPEN': df['open'],
+                             'LOW': df['low'],
+                             'HIGH': df['high'],
+                             'CLOSE': df['close'],
+                             'WAPRICE': (df['value'] / df['volume'] / factor).round(4),
+                             'VOLUME': df['volume'],
+                             'VALUE': df['value']})
+
+    @staticmethod
+    def _bond_metrics(bonds, dates, prices):
+        '''Rough yields, durations and spreads of bonds (a row or a table of self.bonds) for dates and clean prices'''
+        days = (np.asarray(bonds['matdate'], dtype='datetime64[ns]')
+                - np.asarray(dates, dtype='datetime64[ns]')) / np.timedelta64(1, 'D')
+        years = np.maximum(days / 365, 1 / 365)
+        rate = np.asarray(bonds['couponpercent'], dtype='float64')
+        ytm = rate / prices * 100 + (100 - prices) / years
+        return {'EFFECTIVEYIELD': np.round(ytm, 2),
+                'DURATION': np.round(years * 365 / (1 + ytm / 100 * years / 4)).astype('int64'),
+                'GSPREADBP': np.round((ytm - 8) * 100).astype('int64'),
+                'ZSPREADBP': np.round((ytm - 8.2) * 100).astype('int64')}
+
+    # routes, every one returns ({table: DataFrame or compact dict}, {table: (max page size, cursor)})
+
+    def _search(self, params):
+        q = (params.get('q') or '').upper()
+        shares = pd.DataFrame({'secid': self.shares['secid'], 'name': self.shares['secid'] + ' ПАО',
+                               'group': 'stock_shares', 'primary_boardid': 'TQBR'})
+        bonds = pd.DataFrame({'secid': self.bonds['secid'], 'name': self.bonds['name'],
+                              'group': 'stock_bonds', 'primary_boardid': self.bonds['boardid']})
+        df = pd.concat([shares, bonds], ignore_index=True)
+        df = df.loc[df['secid'].str.contains(q, regex=False) | df['name'].str.upper().str.contains(q, regex=False)]
+        df = pd.DataFrame({'id': df.index.to_numpy(dtype='int64'),
+                           'secid': df['secid'],
+                           'shortname': df['secid'],
+                           'name': df['name'],
+                           'isin': df['secid'],
+                           'is_traded': np.ones(len(df), dtype='int64'),
+                           'group': df['group'],
+                           'primary_boardid': df['primary_boardid']})
+        return {'securities': df}, {'securities': (100, False)}
+
+    def _description(self, params, ticker):
+        kind = self._kind(ticker)
+        rows = []
+        if kind == 'share':
+            share = self.shares.loc[ticker]
+            rows = [('SECID', 'Код ценной бумаги', ticker, 'string'),
+                    ('NAME', 'Полное наименование', ticker + ' ПАО', 'string'),
+                    ('SHORTNAME', 'Краткое наименование', ticker, 'string'),
+                    ('ISIN', 'ISIN код', 'RU000' + ticker, 'string'),
+                    ('ISSUESIZE', 'Объем выпуска', str(share['issuesize']), 'number'),
+                    ('FACEVALUE', 'Номинальная стоимость', '1', 'number'),
+                    ('FACEUNIT', 'Валюта номинала', 'SUR', 'string'),
+                    ('ISSUEDATE', 'Дата начала торгов', epoch.strftime('%Y-%m-%d'), 'date'),
+                    ('TYPE', 'Тип бумаги', 'common_share', 'string'),
+                    ('GROUP', 'Код типа инструмента', 'stock_shares', 'string')]
+            board = ('TQBR', 57, 'shares', 1, epoch, None)
+        elif kind == 'bond':
+            bond = self.bonds.loc[ticker]
+            rows = [('SECID', 'Код ценной бумаги', ticker, 'string'),
+                    ('NAME', 'Полное наименование', bond['name'], 'string'),
+                    ('SHORTNAME', 'Краткое наименование', bond['name'], 'string'),
+                    ('ISIN', 'ISIN код', ticker, 'string'),
+                    ('ISSUESIZE', 'Объем выпуска', str(bond['issuesize']), 'number'),
+                    ('FACEVALUE', 'Номинальная стоимость', '1000', 'number'),
+                    ('INITIALFACEVALUE', 'Первоначальная номинальная стоимость', '1000', 'number'),
+                    ('FACEUNIT', 'Валюта номинала', 'SUR', 'string'),
+                    ('ISSUEDATE', 'Дата начала торгов', bond['issuedate'].strftime('%Y-%m-%d'), 'date'),
+                    ('MATDATE', 'Дата погашения', bond['matdate'].strftime('%Y-%m-%d'), 'date'),
+                    ('COUPONFREQUENCY', 'Периодичность выплаты купона в год', str(365 // bond['period']), 'number'),
+                    ('COUPONPERCENT', 'Ставка купона, %', str(bond['couponpercent']), 'number'),
+                    ('TYPE', 'Тип бумаги', 'corporate_bond', 'string'),
+                    ('GROUP', 'Код типа инструмента', 'stock_bonds', 'string')]
+            board = (bond['boardid'], bond_boards[bond['boardid']], 'bonds', 2, bond['issuedate'], bond['matdate'])
+        description = pd.DataFrame(rows, columns=['name', 'title', 'value', 'type'])
+        description['sort_order'] = np.arange(len(description), dtype='int64')
+        description['is_hidden'] = np.zeros(len(description), dtype='int64')
+        description['precision'] = None
+        boards = []
+        if kind is not None:
+            boardid, group, market, market_id, listed, delisted = board
+            boards = [(ticker, boardid, boardid, group, market_id, market, 1, 'stock', 1, 2,
+                       listed, min(delisted or self.today, self.today), listed, delisted, 1, 'SUR')]
+        boards = pd.DataFrame(boards, columns=['secid', 'boardid', 'title', 'board_group_id', 'market_id',
+                                               'market', 'engine_id', 'engine', 'is_traded', 'decimals',
+                                               'history_from', 'history_till', 'listed_from', 'listed_till',
+                                               'is_primary', 'currencyid'])
+        for column in ['history_from', 'history_till', 'listed_from', 'listed_till']:
+            boards[column] = pd.to_datetime(boards[column])
+        for column in ['board_group_id', 'market_id', 'engine_id', 'is_traded', 'decimals', 'is_primary']:
+            boards[column] = boards[column].astype('int64')
+        return {'description': description, 'boards': boards}, None
+
+    def _dividends(self, params, ticker):
+        dates = pd.date_range(epoch, self.today, freq='YS') + pd.Timedelta(days=195)
+        dates = dates[dates <= self.today] if self._kind(ticker) == 'share' else dates[:0]
+        value = _rng(self.seed, ticker, 'dividends').uniform(0.5, 30, len(dates)).round(2)
+        df = pd.DataFrame({'secid': ticker, 'isin': 'RU000' + ticker, 'registryclosedate': dates,
+                           'value': value, 'currencyid': 'RUB'})
+        return {'dividends': df}, None
+
+    def _boards(self, params):
+        df = pd.DataFrame({'id': np.arange(len(bond_boards), dtype='int64'),
+                           'board_group_id': np.array(list(bond_boards.values()), dtype='int64'),
+                           'boardid': list(bond_boards),
+                           'title': list(bond_boards),
+                           'is_traded': np.ones(len(bond_boards), dtype='int64')})
+        return {'boards': df}, None
+
+    def _snapshot_tables(self, tickers):
+        '''securities, marketdata and marketdata_yields rows for tickers as of the last session'''
+        days = self.days[-3:]
+        bars = {'SECID': [], 'PREV': [], 'LAST': []}
+        for ticker in tickers:
+            kind = self._kind(ticker)
+            if kind is None:
+                continue
+            if kind == 'bond' and not self.bonds.loc[ticker, 'issuedate'] <= days[1] < days[2] < \
+                    self.bonds.loc[ticker, 'matdate']:
+                continue
+            closes = self._closes(ticker, days)
+            volatility = self.shares.loc[ticker, 'volatility'] if kind == 'share' else 0.003
+            factor = 1 if kind == 'share' else 10
+            bars['SECID'].append(ticker)
+            bars['PREV'].append(self._session(ticker, days[1], closes[0], closes[1], volatility, factor))
+            bars['LAST'].append(self._session(ticker, days[2], closes[1], closes[2], volatility, factor))
+        secid = pd.Index(bars['SECID'])
+        prev = pd.DataFrame(bars['PREV'], columns=['OPEN', 'CLOSE', 'HIGH', 'LOW', 'VALUE', 'VOLUME', 'WAPRICE'],
+                            index=secid)
+        last = pd.DataFrame(bars['LAST'], columns=prev.columns, index=secid)
+        bonds = self.bonds.reindex(secid)
+        is_bond = bonds['secid'].notna().to_numpy()
+        board = np.where(is_bond, bonds['boardid'], 'TQBR')
+        coupons = self.bondization['coupons']
+        current = coupons.loc[coupons['coupondate'] > self.today].groupby('secid').first().reindex(secid)
+        systime = self.today + pd.Timedelta(hours=18, minutes=40)
+        securities = pd.DataFrame({'SECID': secid,
+                                   'BOARDID': board,
+                                   'SHORTNAME': secid,
+                                   'PREVPRICE': prev['CLOSE'].values,
+                                   'PREVWAPRICE': prev['WAPRICE'].values,
+                                   'PREVLEGALCLOSEPRICE': prev['CLOSE'].values,
+                                   'PREVDATE': days[1],
+                                   'LOTSIZE': np.where(is_bond, 1, 10),
+                                   'FACEVALUE': np.where(is_bond, current['facevalue'].fillna(1000.0), 1.0),
+                                   'FACEUNIT': 'SUR',
+                                   'CURRENCYID': 'SUR',
+                                   'STATUS': 'A',
+                                   'ISIN': secid,
+                                   'MATDATE': bonds['matdate'].values,
+                                   'COUPONPERCENT': bonds['couponpercent'].values,
+                                   'COUPONPERIOD': bonds['period'].astype('Int64').values,
+                                   'NEXTCOUPON': current['coupondate'].values,
+                                   'COUPONVALUE': current['value'].values,
+                                   'ACCRUEDINT': (bonds['couponpercent'] / 100 * current['facevalue']
+                                                  * (self.today - current['startdate']).dt.days / 365).round(2).values,
+                                   'SETTLEDATE': self.today})
+        marketdata = pd.DataFrame({'SECID': secid,
+                                   'BOARDID': board,
+                                   'OPEN': last['OPEN'].values,
+                                   'LOW': last['LOW'].values,
+                                   'HIGH': last['HIGH'].values,
+                                   'LAST': last['CLOSE'].values,
+                                   'WAPRICE': last['WAPRICE'].values,
+                                   'LCURRENTPRICE': last['CLOSE'].values,
+                                   'VALTODAY': last['VALUE'].values,
+                                   'VOLTODAY': last['VOLUME'].values,
+                                   'UPDATETIME': '18:39:59',
+                                   'SEQNUM': int(systime.strftime('%Y%m%d%H%M%S')),
+                                   'SYSTIME': systime})
+        metrics = self._bond_metrics(bonds.loc[is_bond], self.today, last.loc[is_bond, 'CLOSE'].to_numpy())
+        marketdata['DURATION'] = pd.Series(metrics['DURATION'], index=secid[is_bond]).reindex(secid).astype('Int64').values
+        yields = pd.DataFrame({'SECID': secid[is_bond],
+                               'BOARDID': board[is_bond],
+                               'PRICE': last.loc[is_bond, 'CLOSE'].values,
+                               'YIELDDATE': bonds.loc[is_bond, 'matdate'].values,
+                               'YIELDDATETYPE': 'MATDATE',
+                               'WAPRICE': last.loc[is_bond, 'WAPRICE'].values,
+                               'SYSTIME': systime,
+                               **metrics})
+        return {'securities': securities, 'marketdata': marketdata, 'marketdata_yields': yields}
+
+    def _board_tickers(self, board):
+        return self.shares.index if board == 'TQBR' else self.bonds.index[self.bonds['boardid'] == board]
+
+    def _snapshot(self, params, board, ticker=None):
+        tickers = [ticker] if ticker is not None else self._board_tickers(board)
+        tables = dict(self._cached(('snapshot', board, ticker), lambda: self._snapshot_tables(tickers)))
+        for name, df in tables.items():
+            tables[name] = df.loc[df['BOARDID'] == board] if len(df) else df
+        return tables, None
+
+    def _bonds_list(self, params):
+        live = self.bonds.index[(self.bonds['issuedate'] <= self.today) & (self.bonds['matdate'] > self.today)]
+        return self._cached(('bonds_list',), lambda: self._snapshot_tables(live)), None
+
+    def _candles(self, params, ticker):
+        df = self.candles(ticker, params.get('from'), params.get('till'), int(params.get('interval') or 10))
+        return {'candles': df}, {'candles': (500, False)}
+
+    def _history(self, params, ticker):
+        df = self._day_bars(ticker, params.get('from'), params.get('till'))
+        kind = self._kind(ticker)
+        board = 'TQBR' if kind == 'share' else self.bonds.loc[ticker, 'boardid'] if kind else None
+        df.insert(1, 'BOARDID', board)
+        df.insert(2, 'SECID', ticker)
+        df['LEGALCLOSEPRICE'] = df['CLOSE']
+        df['NUMTRADES'] = (df['VOLUME'] // 10 + 1).astype('int64')
+        return {'history': df}, {'history': (100, True)}
+
+    def _history_yields(self, params, ticker):
+        if self._kind(ticker) != 'bond':
+            return {'history_yields': pd.DataFrame(columns=['TRADEDATE', 'SECID', 'BOARDID', 'PRICE'])}, None
+        bars = self._day_bars(ticker, params.get('from'), params.get('till'))
+        df = pd.DataFrame({'TRADEDATE': bars['TRADEDATE'],
+                           'SECID': ticker,
+                           'BOARDID': self.bonds.loc[ticker, 'boardid'],
+                           'PRICE': bars['CLOSE'],
+                           **self._bond_metrics(self.bonds.loc[ticker], bars['TRADEDATE'],
+                                                bars['CLOSE'].to_numpy())})
+        return {'history_yields': df}, {'history_yields': (100, True)}
+
+    def _board_day(self, board, date):
+        '''History rows of every security of a board for one trade date'''
+        params = {'from': date, 'till': date}
+        frames = [self._history(params, ticker)[0]['history'] for ticker in self._board_tickers(board)]
+        frames = [df for df in frames if len(df)]
+        return pd.concat(frames, ignore_index=True) if frames else self._history(params, None)[0]['history']
+
+    def _board_history(self, params, board):
+        date = str(pd.Timestamp(params.get('date') or self.days[-1]).date())
+        df = self._cached(('board_history', board, date), lambda: self._board_day(board, date))
+        return {'history': df}, {'history': (100, True)}
+
+    def _board_history_yields(self, params, board):
+        history = self._board_history(params, board)[0]['history']
+        bonds = self.bonds.reindex(history['SECID'])
+        history = history.loc[bonds['secid'].notna().to_numpy()]
+        bonds = bonds.dropna(subset=['secid'])
+        df = pd.DataFrame({'TRADEDATE': history['TRADEDATE'].values,
+                           'SECID': history['SECID'].values,
+                           'BOARDID': history['BOARDID'].values,
+                           'PRICE': history['CLOSE'].values,
+                           **self._bond_metrics(bonds, history['TRADEDATE'].values, history['CLOSE'].to_numpy())})
+        return {'history_yields': df}, {'history_yields': (100, True)}
+
+    def _bondization(self, params, ticker):
+        tables = {name: df.loc[df['secid'] == ticker] for name, df in self.bondization.items()}
+        return tables, {name: (20 if params.get('limit') != 'unlimited' else 10 ** 9, False) for name in tables}
+
+    def _bondization_list(self, params):
+        date_columns = {'coupons': 'coupondate', 'offers': 'offerdate', 'amortizations': 'amortdate'}
+        tables = {}
+        for name, df in self.bondization.items():
+            dates = df[date_columns[name]]
+            if params.get('from'):
+                df = df.loc[dates >= pd.Timestamp(params['from'])]
+                dates = df[date_columns[name]]
+            if params.get('till'):
+                df = df.loc[dates <= pd.Timestamp(params['till'])]
+            tables[name] = df
+        return tables, {name: (100, True) for name in tables}
+
+    def _zcyc(self, params):
+        days = pd.bdate_range(pd.Timestamp('2014-01-06'), self.today)
+        date = pd.Timestamp(params.get('date') or self.today)
+        day = days[max(days.searchsorted(date, side='right') - 1, 0)]
+        df = synthetic_zcyc_params([day], self.seed)
+        g = df[[f'G{i}' for i in range(1, 10)]].to_numpy()
+        curve = zcurve.g_curve(df['B1'].to_numpy(), df['B2'].to_numpy(), df['B3'].to_numpy(),
+                               df['T1'].to_numpy(), g, np.array(zcyc_periods))
+        yearyields = pd.DataFrame({'tradedate': day,
+                                   'tradetime': '18:40:00',
+                                   'period': zcyc_periods,
+                                   'value': ((np.exp(curve / 10000) - 1) * 100).round(2)})
+        dates = pd.DataFrame({'from': [days[0]], 'till': [days[-1]]})
+        return {'params': df, 'yearyields': yearyields, 'params.dates': dates}, None
+
+    def _zcyc_archive(self):
+        df = synthetic_zcyc_params(pd.bdate_range(pd.Timestamp('2014-01-06'), self.today), self.seed)
+        df['tradedate'] = df['tradedate'].dt.strftime('%d.%m.%Y')
+        text = 'Параметры КБД\n' + df.to_csv(sep=';', decimal=',', index=False)
+        buffer = io.BytesIO()
+        with ZipFile(buffer, 'w') as zip_file:
+            zip_file.writestr('dynamic.csv', text)
+        return buffer.getvalue()
+
+    def _index_analytics(self, params, ticker):
+        weights = _rng(self.seed, ticker, 'weights').random(len(self.shares))
+        df = pd.DataFrame({'indexid': ticker,
+                           'tradedate': self.today,
+                           'ticker': self.shares['secid'].values,
+                           'shortnames': self.shares['secid'].values,
+                           'secids': self.shares['secid'].values,
+                           'weight': (weights / weights.sum() * 100).round(2),
+                           'tradingsession': np.full(len(weights), 3, dtype='int64')})
+        return {'analytics': df}, None
+
+    def _collections(self, params):
+        names = ['stock_index_shares', 'stock_index_bonds']
+        df = pd.DataFrame({'id': np.arange(len(names), dtype='int64'), 'name': names, 'title': names,
+                           'security_group_id': np.full(len(names), 12, dtype='int64')})
+        return {'collections': df}, None
+
+    def _collection(self, params, ticker):
+        df = pd.DataFrame({'secid': ['IMOEX', 'RGBI'], 'boardid': 'SNDX', 'name': ['Индекс МосБиржи', 'RGBI']})
+        return {'securities': df}, None
+
+
+def _compact(df: pd.DataFrame):
+    '''Converts a DataFrame to an ISS compact table: {metadata, columns, data}'''
+    metadata = {}
+    data = []
+    for column in df.columns:
+        values = df[column]
+        iss_type = iss_types.get(column)
+        missing = values.isna().to_numpy()
+        if pd.api.types.is_datetime64_any_dtype(values):
+            array = values.to_numpy(dtype='datetime64[s]')
+            if iss_type is None:
+                known = array[~missing]
+                iss_type = 'date' if (known.astype('datetime64[D]') == known).all() else 'datetime'
+            array = np.datetime_as_string(array, unit='D' if iss_type == 'date' else 's')
+            array = (np.char.replace(array, 'T', ' ') if len(array) else array).astype(object)
+        else:
+            if iss_type is None and pd.api.types.is_bool_dtype(values):
+                iss_type = 'boolean'
+                values = values.astype('Int64')
+            elif iss_type is None and pd.api.types.is_integer_dtype(values):
+                iss_type = 'int64'
+            elif iss_type is None and pd.api.types.is_float_dtype(values):
+                iss_type = 'double'
+            elif iss_type is None:
+                iss_type = 'string'
+            array = values.to_numpy(dtype=object)
+        if missing.any():
+            array = array.copy()
+            array[missing] = None
+        metadata[column] = {'type': iss_type}
+        data.append(array)
+    rows = np.column_stack(data).tolist() if len(df) and data else []
+    return {'metadata': metadata, 'columns': list(df.columns), 'data': rows}
+
+
+def record_fixture(directory: str, url: str, **kwargs):
+    '''
+    Downloads an ISS response (all tables) and stores it under directory by its path,
+    so IssEmulator(fixtures=directory) replays it.
+    Example:
+        record_fixture('fixtures', moex_reader.urls['description'] + '.json', ticker='SBER')
+    '''
+    response = url_reader.read_url(url, **kwargs)
+    response.raise_for_status()
+    path = urlsplit(response.url).path
+    path = re.sub(r'\.json$', '', path[path.find('/iss/') + len('/iss/'):]).strip('/')
+    target = os.path.join(directory, path + '.json')
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, 'wb') as f:
+        f.write(response.content)
+    return target
+
+
+class EmulatorAdapter(BaseAdapter):
+    '''requests transport adapter answering from an IssEmulator without any network'''
+
+    def __init__(self, emulator: IssEmulator):
+        super().__init__()
+        self.emulator = emulator
+
+    def send(self, request, **kwargs):
+        parts = urlsplit(request.url)
+        try:
+            status, headers, body = self.emulator.handle(parts.path, dict(parse_qsl(parts.query)))
+        except ConnectionResetError as e:
+            raise requests.ConnectionError(e, request=request)
+        response = requests.Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict(headers)
+        response._content = body
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        response.reason = 'OK' if status == 200 else 'Error'
+        return response
+
+    def close(self):
+        pass
+
+
+def serve(emulator: IssEmulator, host: str = '127.0.0.1', port: int = 0):
+    '''
+    Serves an IssEmulator over HTTP in a background thread and returns the server.
+    The ISS base url is f'http://{host}:{server.server_port}/iss'; call server.shutdown() to stop it.
+    '''
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            parts = urlsplit(self.path)
+            try:
+                status, headers, body = emulator.handle(parts.path, dict(parse_qsl(parts.query)))
+            except ConnectionResetError:
+                self.close_connection = True
+                return
+            self.send_response(status)
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def install(emulator: IssEmulator = None, base_url: str = 'http://iss.emulator', **transport_kwargs):
+    '''
+    Points Moex at an in-process emulator: url_reader gets a Transport whose session
+    answers base_url from the emulator, and moex_reader urls are moved to base_url.
+    transport_kwargs go to Transport (e.g. backoff=0 to retry injected errors at once).
+    Returns the emulator.
+    '''
+    emulator = emulator if emulator is not None else IssEmulator()
+    session = pooled_session()
+    session.mount(base_url, EmulatorAdapter(emulator))
+    url_reader.set_transport(Transport(session=session, **transport_kwargs))
+    moex_reader.set_base_url(base_url + '/iss', base_url + '/iss/downloads')
+    return emulator
+
+
+def uninstall():
+    '''Restores the default transport and iss.moex.com urls'''
+    url_reader.set_transport()
+    moex_reader.set_base_url()
@@ -0,0 +1,117 @@
+import time
+import asyncio
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+
+from url_reader import read_url, decode, to_frame
+from moex_reader import Moex, urls
+
+# Moscow time, MOEX has no daylight saving time
+moscow = dt.timezone(dt.timedelta(hours=3))
+# weekday hours (Moscow time) when some MOEX session is running
+trading_hours = (dt.time(6, 50), dt.time(23, 50))
+
+
+def in_session(now: dt.datetime = None):
+    '''True on weekdays between trading_hours'''
+    now = dt.datetime.now(moscow) if now is None else now
+    return now.weekday() < 5 and trading_hours[0] <= now.time() <= trading_hours[1]
+
+
+class MarketWatch:
+    '''
+    Polls board-level marketdata snapshots and reports only the rows that changed.
+    One request per board serves all of its tickers. The last snapshot of every board
+    is kept as a SECID index and an array of SEQNUM (UPDATETIME when there is no SEQNUM),
+    and only changed rows are converted to DataFrames.
+    - tickers: tickers to watch, grouped by their primary boards
+    - boards: (engine, market, board) tuples to watch completely
+    - interval: seconds between polls while rows keep changing; without changes the
+      delay doubles up to idle_interval, which is also used outside trading sessions
+    - columns: marketdata columns to request, None for all
+
+    Example:
+        watch(['SBER', 'GAZP'], interval=5).run(print)
+        async for changes in watch(boards=[('stock', 'bonds', 'TQCB')]):
+            ...
+    '''
+
+    def __init__(self, tickers=None, boards=None, interval: float = 5, idle_interval: float = 60,
+                 columns: list = None):
+        self.groups = {}
+        for ticker in tickers or []:
+            info = Moex(ticker).get_info()
+            self.groups.setdefault((info['engine'], info['market'], info['board']), set()).add(ticker)
+        for board in boards or []:
+            self.groups[tuple(board)] = None
+        self.interval = interval
+        self.idle_interval = idle_interval
+        self.delay = interval
+        self.columns = None if columns is None else list(dict.fromkeys(['SECID', 'BOARDID', 'SEQNUM',
+                                                                        'UPDATETIME'] + list(columns)))
+        self.state = {}
+
+    def _poll_board(self, key, tickers):
+        engine, market, board = key
+        response = read_url(urls['board_securities'] + '.json', engine=engine, market=market, board=board,
+                            meta='on', table='marketdata', columns=self.columns, cache=False)
+        response.raise_for_status()
+        table = decode(response)['marketdata']
+        columns, rows = table['columns'], table['data']
+        i = columns.index('SECID')
+        j = columns.index('SEQNUM' if 'SEQNUM' in columns else 'UPDATETIME')
+        secid = np.array([row[i] for row in rows], dtype='object')
+        seq = np.array([row[j] for row in rows], dtype='object')
+        index = pd.Index(secid)
+        previous = self.state.get(key)
+        if previous is None or len(previous[1]) == 0:
+            changed = np.ones(len(rows), dtype='bool')
+        else:
+            positions = previous[0].get_indexer(index)
+            changed = (positions < 0) | (seq != previous[1][np.maximum(positions, 0)])
+        if tickers is not None:
+            changed &= np.isin(secid, list(tickers))
+        self.state[key] = (index, seq)
+        picked = [rows[i] for i in np.flatnonzero(changed)]
+        return to_frame(picked, columns, table['metadata'], getattr(response, 'iss_endpoint', None))
+
+    def poll(self):
+        '''Reads every board once and returns the changed rows of all of them (the first poll returns all)'''
+        frames = [self._poll_board(key, tickers) for key, tickers in self.groups.items()]
+        frames = [df for df in frames if len(df)]
+        changes = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        if not in_session():
+            self.delay = self.idle_interval
+        elif len(changes):
+            self.delay = self.interval
+        else:
+            self.delay = min(self.idle_interval, self.delay * 2)
+        return changes
+
+    def run(self, callback, stop=None):
+        '''
+        Polls until stop() returns True (forever by default) and calls callback(changes)
+        for every poll with changes.
+        '''
+        while stop is None or not stop():
+            changes = self.poll()
+            if len(changes):
+                callback(changes)
+            time.sleep(self.delay)
+
+    async def __aiter__(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            changes = await loop.run_in_executor(None, self.poll)
+            if len(changes):
+                yield changes
+            await asyncio.sleep(self.delay)
+
+
+def watch(tickers=None, boards=None, interval: float = 5, idle_interval: float = 60, columns: list = None):
+    '''Returns a MarketWatch over tickers and/or (engine, market, board) tuples'''
+    if isinstance(tickers, str):
+        tickers = [tickers]
+    return MarketWatch(tickers, boards, interval, idle_interval, columns)
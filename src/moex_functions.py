@@ -1,33 +1,92 @@
+import functools
+import numpy as np
 import pandas as pd
 
+# low-cardinality codes stored as categories
+category_columns = {'boardid', 'primary_boardid', 'faceunit', 'currencyid', 'marketcode',
+                    'sectype', 'status', 'tradingstatus'}
+
+date_formats = {'date': '%Y-%m-%d',
+                'datetime': '%Y-%m-%d %H:%M:%S'}
+
+def _to_float(values):
+	try:
+		return values.astype('float64')
+	except (TypeError, ValueError):
+		return pd.to_numeric(pd.Series(values), errors='coerce').to_numpy(dtype='float64')
+
+def _to_int(values):
+	mask = pd.isna(values)
+	try:
+		return pd.arrays.IntegerArray(np.where(mask, 0, values).astype('int64'), mask)
+	except (TypeError, ValueError):
+		values = _to_float(values)
+		if np.all(np.isnan(values) | (values == np.round(values))):
+			return pd.array(values, dtype='Int64')
+		return values
+
+def _to_bool(values):
+	mask = pd.isna(values)
+	try:
+		return pd.arrays.BooleanArray(np.where(mask, 0, values).astype('bool'), mask)
+	except (TypeError, ValueError):
+		values = _to_float(values)
+		return pd.arrays.BooleanArray(np.nan_to_num(values) != 0, np.isnan(values))
+
+def _to_datetime(values, format):
+	# ISS tables repeat the same dates a lot, so every distinct value is parsed once
+	codes, uniques = pd.factorize(values)
+	parsed = pd.to_datetime(uniques, format=format, errors='coerce').values.astype('datetime64[ns]')
+	return np.append(parsed, np.datetime64('NaT', 'ns'))[codes]
+
+def _to_category(values):
+	codes, uniques = pd.factorize(values)
+	return pd.Categorical.from_codes(codes, uniques)
+
+def _to_object(values):
+	return values
+
+@functools.lru_cache(maxsize=512)
+def compile_converter(signature):
+	"""
+	Returns a tuple of (column, converter) for a signature of (column, ISS type) pairs.
+	Converters are cached per ISS metadata signature.
+	"""
+	converters = []
+	for column, iss_type in signature:
+		if iss_type in date_formats:
+			func = functools.partial(_to_datetime, format=date_formats[iss_type])
+		elif iss_type in ['double', 'number']:
+			func = _to_float
+		elif iss_type in ['int32', 'int64']:
+			func = _to_int
+		elif iss_type == 'boolean':
+			func = _to_bool
+		elif column.lower() in category_columns:
+			func = _to_category
+		else:
+			func = _to_object
+		converters.append((column, func))
+	return tuple(converters)
+
+def _signature(columns, dic):
+	return tuple((column, dic[column]['type'] if column in dic else 'undefined') for column in columns)
+
+def make_frame(data, columns, dic):
+	"""
+	Builds a typed DataFrame straight from ISS JSON rows in one pass.
+	- data: list of rows or a 2-D object array, columns: list of column names, dic: ISS metadata
+	"""
+	converters = compile_converter(_signature(tuple(columns), dic))
+	values = np.asarray(data, dtype='object').reshape(len(data), len(columns))
+	return pd.DataFrame({column: func(values[:, i]) for i, (column, func) in enumerate(converters)},
+	                    columns=list(columns))
+
 def make_new_types(x, dic):
-	replace_dict = {'string': 'object',
-                  'double': 'float64',
-                  'date': 'datetime64[ns]',
-                  'datetime': 'datetime64[ns]',
-                  'int32': 'float64',
-                  'int64': 'float64',
-                  'undefined': 'object',
-                  'time': 'object',
-                  'number': 'float64',
-                  'boolean': 'float64'}
-	short_dict = {}
-	for key, value in dic.items():
-		short_dict[key] = value['type']
-	new_dict = {}
-	for key, value in short_dict.items():
-		if value in replace_dict:
-			value = replace_dict[value]
-			new_dict[key] = value
-	date_cols = [key for key, value in new_dict.items()
-			   if value == 'datetime64[ns]']
-	for col in date_cols:
-		x[col] = pd.to_datetime(x[col], errors='coerce')
-	int_cols = [key for key, value in new_dict.items() if value == 'float64']
-	for col in int_cols:
-		x[col] = pd.to_numeric(x[col], errors='coerce')
-	x = x.astype(new_dict)
-	return x
+	"""Converts columns of a DataFrame according to ISS metadata"""
+	converters = compile_converter(_signature(tuple(x.columns), dic))
+	return pd.DataFrame({column: func(x[column].to_numpy(dtype='object')) for column, func in converters},
+	                    index=x.index, columns=x.columns)
 
 def convert_variable(variable, variable_type):
 	type_convert = {'string': str,
@@ -45,3 +104,25 @@ def convert_variable(variable, variable_type):
 		return conversion_func(variable)
 	else:
 		return variable
+
+def concat_frames(frames):
+	"""
+	Concatenates typed chunks of one table. Category columns whose chunks carry
+	different categories are recategorised instead of falling back to object.
+	"""
+	frames = list(frames)
+	df = pd.concat(frames, ignore_index=True)
+	for column in df.columns:
+		if isinstance(frames[0][column].dtype, pd.CategoricalDtype) and not isinstance(df[column].dtype, pd.CategoricalDtype):
+			df[column] = _to_category(df[column].to_numpy(dtype='object'))
+	return df
+
+def date_windows(date_from, date_to, days: int):
+	"""Splits [date_from, date_to] into consecutive inclusive [start, end] ranges of at most days days"""
+	date_from, date_to = pd.Timestamp(date_from).date(), pd.Timestamp(date_to).date()
+	windows = []
+	while date_from <= date_to:
+		end = min(date_to, date_from + pd.Timedelta(days=days - 1))
+		windows.append((date_from, end))
+		date_from = end + pd.Timedelta(days=1)
+	return windows
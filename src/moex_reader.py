@@ -1,77 +1,174 @@
+import os
+import itertools
 import pandas as pd
 import numpy as np
 import requests
 import datetime as dt
 from zipfile import ZipFile
 from io import BytesIO
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 import moex_functions as mfunc
+import zcurve
+import instrumentation
+from candle_aggregation import aggregate_candles, can_derive, interval_order
 
-from url_reader import read_url, read_url_loop, url_processed, loop_processed
-
-urls = {'description': 'https://iss.moex.com/iss/securities/%(ticker)s',
-        'securities' : 'https://iss.moex.com/iss/securities',
-        'bonds_list': 'https://iss.moex.com/iss/engines/stock/markets/bonds/',
-        'market_data': 'https://iss.moex.com/iss/engines/%(engine)s/markets/%(market)s/boards/%(board)s/securities/%(ticker)s',
-        'history_yields': 'https://iss.moex.com/iss/history/engines/%(engine)s/markets/%(market)s/boards/%(board)s/yields/%(ticker)s',
-        'bondization': 'https://iss.moex.com/iss/statistics/engines/stock/markets/bonds/bondization/%(ticker)s',
-        'history_dividends': 'https://iss.moex.com/iss/securities/%(ticker)s/dividends',
-        'history': 'https://iss.moex.com/iss/history/engines/%(engine)s/markets/%(market)s/boards/%(board)s/securities/%(ticker)s',
-        'zcyz' : 'https://iss.moex.com/iss/engines/stock/zcyc/',
-        'candles' : 'http://iss.moex.com/iss/engines/%(engine)s/markets/%(market)s/boards/%(board)s/securities/%(ticker)s/candles',
-        'indices': 'https://iss.moex.com/iss/statistics/engines/stock/markets/index/analytics/%(ticker)s',
-        'indices_collections': 'https://iss.moex.com/iss/securitygroups/stock_index/collections/%(ticker)s'}
+from url_reader import read_url, url_processed, tables_processed, iter_processed, decode
+from security_cache import security_cache
+from async_reader import AsyncReader
+
+base_url = 'https://iss.moex.com/iss'
+downloads_url = 'http://moex.com/iss/downloads'
+
+paths = {'description': '/securities/%(ticker)s',
+         'securities' : '/securities',
+         'bonds_list': '/engines/stock/markets/bonds/',
+         'market_data': '/engines/%(engine)s/markets/%(market)s/boards/%(board)s/securities/%(ticker)s',
+         'board_securities': '/engines/%(engine)s/markets/%(market)s/boards/%(board)s/securities',
+         'history_yields': '/history/engines/%(engine)s/markets/%(market)s/boards/%(board)s/yields/%(ticker)s',
+         'bondization': '/statistics/engines/stock/markets/bonds/bondization/%(ticker)s',
+         'bondization_list': '/statistics/engines/stock/markets/bonds/bondization',
+         'history_dividends': '/securities/%(ticker)s/dividends',
+         'history': '/history/engines/%(engine)s/markets/%(market)s/boards/%(board)s/securities/%(ticker)s',
+         'board_history': '/history/engines/%(engine)s/markets/%(market)s/boards/%(board)s/securities',
+         'board_history_yields': '/history/engines/%(engine)s/markets/%(market)s/boards/%(board)s/yields',
+         'zcyz' : '/engines/stock/zcyc/',
+         'candles' : '/engines/%(engine)s/markets/%(market)s/boards/%(board)s/securities/%(ticker)s/candles',
+         'indices': '/statistics/engines/stock/markets/index/analytics/%(ticker)s',
+         'indices_collections': '/securitygroups/stock_index/collections/%(ticker)s'}
+
+urls = {}
+
+def set_base_url(iss: str = None, downloads: str = None):
+    '''
+    Points all ISS urls at another server, e.g. a local iss_emulator.
+    Called without arguments it restores iss.moex.com.
+    '''
+    urls.update({name: (iss or base_url) + path for name, path in paths.items()})
+    urls['zcyc_archive'] = (downloads or downloads_url) + '/engines/stock/zcyc/dynamic.csv.zip'
+    # metadata cached from another server does not apply any more
+    security_cache.invalidate()
+
+set_base_url()
+
+price_fallback = {'CLOSE': 'LAST_1',
+                  'LCURRENTPRICE': 'LAST_2',
+                  'LEGALCLOSEPRICE': 'LAST_3'}
+price_columns = ['LAST', 'LAST_1', 'LAST_2', 'LAST_3']
+# operation order within one date in a bond schedule
+schedule_backfill_order = {'issue': 0,
+                           'offer': 1,
+                           'amortization': 2,
+                           'maturity': 3,
+                           'coupon': 4}
+# days of data per download shard, sized so that a shard is a few thousand rows;
+# weekly, monthly and quarterly candles would be cut at shard borders and are not sharded
+shard_days = {1: 31,
+              10: 183,
+              60: 730,
+              24: 3650,
+              7: None,
+              31: None,
+              4: None,
+              'history': 1825,
+              'history_yields': 1825}
+# shards downloaded at the same time
+shard_workers = 8
+# column identifying a row, used to drop duplicates at shard boundaries
+shard_keys = {'candles': 'begin',
+              'history': 'TRADEDATE',
+              'history_yields': 'TRADEDATE'}
+# tenors of the zcyc yearyields table
+zcyc_periods = [0.25, 0.5, 0.75, 1, 2, 3, 5, 7, 10, 15, 20, 30]
+schedule_order = {'issue': 0,
+                  'coupon': 1,
+                  'offer': 2,
+                  'amortization': 3,
+                  'maturity': 4}
 
 class Moex:
-    session = requests.Session()
+    # None sends every request through url_reader.transport (see url_reader.set_transport)
+    session = None
+    async_reader = AsyncReader(session=session)
+    # set to a history_store.HistoryStore to serve history and candles from a local store
+    history_store = None
+    # set to a curve_archive.CurveArchive to serve past zero-coupon curves from a local archive
+    zcurve_archive = None
+    # set to 1 or 10 to build every coarser candle interval locally from these base bars
+    candle_base = None
     
     def __init__(self, ticker):
         self.session = Moex.session
         self.ticker = ticker
 
-    def get_board(self):
-        '''Returns list of stock exchange boards for a ticker'''
-        kwargs = {'ticker': self.ticker,
+    @staticmethod
+    def _load_info(ticker):
+        '''Downloads boards and description tables for a ticker and parses them into one record'''
+        kwargs = {'ticker': ticker,
                   'iss.meta': 'on',
                   'limit': 'unlimited'}
         url = urls['description'] + '.json'
-        response = read_url(url=url,
-                            **kwargs).json()['boards']
+        response = decode(read_url(url=url,
+                                   session=Moex.session,
+                                   meta='on',
+                                   **kwargs))
+        boards = pd.DataFrame(response['boards']['data'], columns=response['boards']['columns'])
+        primary = boards.loc[boards['is_primary'] == 1]
+        if primary.empty:
+            raise ValueError(f'ERROR {ticker} - unknown ticker')
+        primary = primary.iloc[0]
+        description = mfunc.make_frame(response['description']['data'],
+                                       response['description']['columns'],
+                                       response['description']['metadata'])
+        description['name'] = [x.lower() for x in description['name']]
+        # raw (value, type) pairs, converted on request so one malformed value does not break the record
+        params = dict(zip(description['name'], zip(description['value'], description['type'])))
+        return {'secid': ticker,
+                'board': primary['boardid'],
+                'market': primary['market'],
+                'engine': primary['engine'],
+                'currency': primary['currencyid'],
+                'faceunit': Moex._convert_param(params, 'faceunit'),
+                'facevalue': Moex._convert_param(params, 'facevalue'),
+                'issuedate': Moex._convert_param(params, 'issuedate'),
+                'matdate': Moex._convert_param(params, 'matdate'),
+                'params': params,
+                'boards': boards,
+                'description': description}
+
+    @staticmethod
+    def _convert_param(params, name):
+        '''Converts a raw description param to its ISS type, None if it is missing or malformed'''
+        if name not in params:
+            return None
         try:
-            return [x[1] for x in response['data'] if x[14] == 1][0]
-        except:
-            raise ValueError(f'ERROR {self.ticker} - unknown ticker')
+            return mfunc.convert_variable(*params[name])
+        except (TypeError, ValueError):
+            return None
+
+    def get_info(self):
+        '''Returns a cached metadata record for a ticker: primary board, market, engine, currency, description params'''
+        return security_cache.get(self.ticker, self._load_info)
+
+    def _board_kwargs(self):
+        info = self.get_info()
+        return {'engine': info['engine'],
+                'market': info['market'],
+                'board': info['board']}
+
+    def get_board(self):
+        '''Returns primary stock exchange board for a ticker'''
+        return self.get_info()['board']
     
     def get_market(self):
-        '''Returns list of stock exchange boards for a ticker'''
-        kwargs = {'ticker': self.ticker,
-                  'iss.meta': 'on',
-                  'limit': 'unlimited'}
-        url = urls['description'] + '.json'
-        response = read_url(url=url,
-                          session=self.session,
-                          **kwargs).json()['boards']
-        try:
-            return [x[5] for x in response['data'] if x[14] == 1][0]
-        except:
-            raise ValueError(f'ERROR {self.ticker} - unknown ticker')
-
+        '''Returns market of the primary board for a ticker'''
+        return self.get_info()['market']
     
     def get_engine(self):
-        '''Returns list of stock exchange boards for a ticker'''
-        kwargs = {'ticker': self.ticker,
-                  'iss.meta': 'on',
-                  'limit': 'unlimited'}
-        url = urls['description'] + '.json'
-        response = read_url(url=url,
-                          session=self.session,
-                          **kwargs).json()['boards']
-        try:
-            return [x[7] for x in response['data'] if x[14] == 1][0]
-        except:
-            raise ValueError(f'ERROR {self.ticker} - unknown ticker')
+        '''Returns engine of the primary board for a ticker'''
+        return self.get_info()['engine']
 
-    
     def get_description(self, param=None):
         '''
         Return a dataframe with description of a ticker
@@ -114,24 +211,15 @@ class Moex:
         'couponpercent': 'Ставка купона, %' \n
         'couponvalue': 'Сумма купона, в валюте номинала'
         '''
-        kwargs = {'ticker': self.ticker,
-                  'iss.meta': 'on',
-                  'limit': 'unlimited'}
-        table = 'description'
-        url = urls[table] + '.json'
-        df = url_processed(url, table = table, **kwargs)
-        df['name'] = [x.lower() for x in df['name']]
+        info = self.get_info()
         if param:
             try:
-                var_type = df.query(f'name == "{param}"')['type'].values[0]
-                var = df.query(f'name == "{param}"')['value'].values[0]
-                var = mfunc.convert_variable(var, var_type)
-                return var
-            except:
+                return mfunc.convert_variable(*info['params'][param])
+            except (KeyError, TypeError, ValueError):
                 print(f'Unknown param for a {self.ticker}')
                 return None
         else:
-            return df[['name', 'title', 'value']]
+            return info['description'][['name', 'title', 'value']].copy()
         
     def _parse_market_data(self):
         """
@@ -143,13 +231,11 @@ class Moex:
         kwargs = {'ticker': self.ticker,
                   'iss.meta': 'on',
                   'limit': 'unlimited',                  
-                  'engine' : self.get_engine(),
-                  'market' : self.get_market(),
-                  'board' : self.get_board()}
+                  **self._board_kwargs()}
         url = urls['market_data'] + '.json'
-        response = read_url(url=url,
-                        session=self.session,
-                        **kwargs).json()
+        response = decode(read_url(url=url,
+                                   session=self.session,
+                                   **kwargs))
         table = []
         for t in ['securities', 'marketdata_yields', 'marketdata']:
             try:
@@ -164,7 +250,7 @@ class Moex:
             return []
         return table
         
-    def _parse_history_yields(self, date_from: str = None, date_to: str = None):
+    def _parse_history_yields(self, date_from: str = None, date_to: str = None, columns: list = None):
         """
         Parses historical yield data for a given ticker within a specified date range.
 
@@ -173,32 +259,90 @@ class Moex:
                                        Defaults to 30 days before the current date if not provided.
             date_to (str, optional): The end date for the data retrieval in 'YYYY-MM-DD' format. 
                                      Defaults to the current date if not provided.
+            columns (list, optional): Columns to request from ISS. Defaults to all columns.
         Returns:
             pd.DataFrame: A DataFrame containing the historical yield data with appropriate columns and data types.
         """
         date_from = (dt.datetime.now() - dt.timedelta(days=30)).date() if date_from == None else date_from
         date_to = dt.datetime.now().date() if date_to == None else date_to
-        table = 'history_yields'
+        return self._download_sharded('history_yields', date_from, date_to, columns=columns)
+
+    def _download_sharded(self, table: str, date_from, date_to, columns: list = None, **params):
+        '''
+        Downloads a date range of a paginated table as shards of shard_days days in parallel,
+        then drops rows repeated at shard boundaries and sorts the result.
+        Shards that fail are listed in df.attrs['failed_ranges'] as (from, to, error);
+        when every shard fails the error is raised.
+        '''
+        days = shard_days.get(params.get('interval') if table == 'candles' else table, 365)
+        shards = [(date_from, date_to)] if days is None else mfunc.date_windows(date_from, date_to, days)
+        # an empty range is still requested once, ISS answers it with an empty typed table
+        shards = shards or [(date_from, date_to)]
+        fetch = instrumentation.bind(
+            lambda a, b: mfunc.concat_frames(self._iter_table(table, a, b, columns=columns, prefetch=2, **params)))
+        frames, failed = [], []
+        with ThreadPoolExecutor(max_workers=max(1, min(shard_workers, len(shards)))) as pool:
+            futures = [(a, b, pool.submit(fetch, a, b)) for a, b in shards]
+            for a, b, future in futures:
+                try:
+                    frames.append(future.result())
+                except (requests.RequestException, ValueError) as e:
+                    if len(failed) == len(shards) - 1 and not frames:
+                        raise
+                    failed.append((a, b, repr(e)))
+        df = mfunc.concat_frames(frames)
+        key = shard_keys.get(table)
+        if key in df.columns and len(frames) > 1:
+            df = df.drop_duplicates(subset=[key], keep='last').sort_values(by=key).reset_index(drop=True)
+        if failed:
+            print(f'{self.ticker} {table}: failed to download ' + ', '.join(f'{a}..{b}' for a, b, _ in failed))
+        df.attrs['failed_ranges'] = failed
+        return df
+
+    def _iter_table(self, table: str, date_from, date_to, columns: list = None, window: int = None,
+                    prefetch: int = 8, **params):
+        '''
+        Yields typed chunks of a paginated per-ticker table: one per page, or one per
+        window of days when window is given (pages of a window are concatenated).
+        '''
         kwargs = {
         'ticker': self.ticker,
         'iss.meta': 'on',
-        'limit': 'unlimited',    
-        'engine' : self.get_engine(),
-        'market' : self.get_market(),
-        'board' : self.get_board(),
-        'date_from': date_from,
-        'date_to': date_to,
-        'table': table}
+        'limit': 'unlimited',
+        **self._board_kwargs(),
+        'columns': columns,
+        **params}
         url = urls[table] + '.json'
-        response = read_url_loop(url, **kwargs)
-        meta = response[0][table]['metadata']
-        cols = response[0][table]['columns']
-        data = [x for sub in [x[table]['data'] for x in response] for x in sub]
-        df = pd.DataFrame(data, columns=cols)
-        df = mfunc.make_new_types(df, meta)
-        return df
+        ranges = [(date_from, date_to)] if window is None else mfunc.date_windows(date_from, date_to, window)
+        for start, end in ranges:
+            chunks = iter_processed(url, table, prefetch=prefetch, date_from=start, date_to=end, **kwargs)
+            if window is None:
+                yield from chunks
+            else:
+                yield mfunc.concat_frames(chunks)
+
+    def iter_history(self, date_from: str = None, date_to: str = None, columns: list = None,
+                     window: int = None, prefetch: int = 4):
+        """
+        Streams daily trading results as typed DataFrame chunks instead of one frame,
+        so arbitrarily long ranges are read with constant memory.
+
+        Args:
+            date_from (str, optional): The start date in 'YYYY-MM-DD' format. Defaults to 30 days ago.
+            date_to (str, optional): The end date in 'YYYY-MM-DD' format. Defaults to today.
+            columns (list, optional): Columns to request from ISS. Defaults to all columns.
+            window (int, optional): Yield one chunk per window of this many days instead of one per page.
+            prefetch (int): Pages requested ahead of the consumer.
+        Yields:
+            pd.DataFrame: Consecutive chunks of the history table.
+        Example:
+            sinks.consume(Moex('SBER').iter_history('2010-01-01'), sinks.CsvSink('sber.csv'))
+        """
+        date_from = (dt.datetime.now() - dt.timedelta(days=30)).date() if date_from == None else date_from
+        date_to = dt.datetime.now().date() if date_to == None else date_to
+        return self._iter_table('history', date_from, date_to, columns=columns, window=window, prefetch=prefetch)
     
-    def _parse_history_results(self, date_from: str = None, date_to: str = None):
+    def _parse_history_results(self, date_from: str = None, date_to: str = None, columns: list = None):
         """
         Parses historical trading data for a given ticker within a specified date range.
 
@@ -207,39 +351,27 @@ class Moex:
                                        Defaults to 30 days before the current date if not provided.
             date_to (str, optional): The end date for the data retrieval in 'YYYY-MM-DD' format. 
                                      Defaults to the current date if not provided.
+            columns (list, optional): Columns to request from ISS. Defaults to all columns.
         Returns:
             pd.DataFrame: A DataFrame containing the historical yield data with appropriate columns and data types.
         """
         date_from = (dt.datetime.now() - dt.timedelta(days=30)).date() if date_from == None else date_from
         date_to = dt.datetime.now().date() if date_to == None else date_to
-        table = 'history'
-        kwargs = {
-        'ticker': self.ticker,
-        'iss.meta': 'on',
-        'limit': 'unlimited',    
-        'engine' : self.get_engine(),
-        'market' : self.get_market(),
-        'board' : self.get_board(),
-        'date_from': date_from,
-        'date_to': date_to,
-        'table': table}
-        url = urls[table] + '.json'
-        response = read_url_loop(url, **kwargs)
-        meta = response[0][table]['metadata']
-        cols = response[0][table]['columns']
-        data = [x for sub in [x[table]['data'] for x in response] for x in sub]
-        df = pd.DataFrame(data, columns=cols)
-        df = mfunc.make_new_types(df, meta)
-        return df
+        if Moex.history_store is not None:
+            df = Moex.history_store.read(self.ticker, self.get_board(), 'history', date_from, date_to,
+                                         self._download_history, date_col='TRADEDATE')
+            return df if columns is None else df[list(columns)]
+        return self._download_history(date_from, date_to, columns=columns)
+
+    def _download_history(self, date_from, date_to, columns: list = None):
+        return self._download_sharded('history', date_from, date_to, columns=columns)
     
     def get_offers(self):
         '''Returns a schedule of offers for a bond:'''
         kwargs = {'ticker': self.ticker,
         'iss.meta': 'on',
         'limit': 'unlimited',  
-        'engine' : self.get_engine(),
-        'market' : self.get_market(),
-        'board' : self.get_board(),
+        **self._board_kwargs(),
         'table': 'offers'}
         url = urls['bondization'] + '.json'
         try:
@@ -276,20 +408,191 @@ class Moex:
                 data = data.iloc[-1]
             else:
                 return []
-        data.rename(index={'CLOSE' : 'LAST_1',
-                            'LCURRENTPRICE' : 'LAST_2',
-                            'LEGALCLOSEPRICE' : 'LAST_3'}, inplace=True, errors='ignore')
-        data = data.reindex(['LAST', 'LAST_1', 'LAST_2', 'LAST_3', 'WAPRICE'])
+        data.rename(index=price_fallback, inplace=True, errors='ignore')
+        data = data.reindex(price_columns + ['WAPRICE'])
         if self.get_engine() == 'futures':
-            lp = data[data[['LAST', 'LAST_1', 'LAST_2', 'LAST_3']].first_valid_index()]
-            wap = data[data[['LAST', 'LAST_1', 'LAST_2', 'LAST_3']].first_valid_index()]
+            lp = data[data[price_columns].first_valid_index()]
+            wap = data[data[price_columns].first_valid_index()]
         else:
-            lp = data[data[['LAST', 'LAST_1', 'LAST_2', 'LAST_3']].first_valid_index()]
+            lp = data[data[price_columns].first_valid_index()]
             wap = data['WAPRICE']
         if type == 'last':
             return lp
         return wap
-            
+
+    @staticmethod
+    def get_prices(tickers, type: str = 'last', max_workers: int = 8):
+        """
+        Returns current prices for a list of tickers.
+        Tickers are grouped by (engine, market, board) and every group is served by one
+        board-level snapshot request. Primary boards of tickers missing from security_cache
+        are looked up concurrently (see _get_infos), so once they are cached the number of
+        requests grows with the number of boards only.
+
+        Parameters:
+            tickers (list): A list of tickers.
+            type (last or wap): The type of price to be considered. Default: last.
+            max_workers (int): Metadata requests sent at the same time.
+        Returns:
+            pd.DataFrame: A DataFrame indexed by SECID with BOARDID and PRICE columns.
+            Tickers without data get NaN prices.
+        """
+        groups = {}
+        for ticker, info in Moex._get_infos(tickers, max_workers).items():
+            groups.setdefault((info['engine'], info['market'], info['board']), []).append(ticker)
+        prices = []
+        for (engine, market, board), group in groups.items():
+            kwargs = {'engine': engine,
+                      'market': market,
+                      'board': board,
+                      'meta': 'on'}
+            tables = tables_processed(urls['board_securities'] + '.json',
+                                      ['securities', 'marketdata', 'marketdata_yields'],
+                                      session=Moex.session,
+                                      **kwargs)
+            data = Moex._merge_snapshot(tables, board, pd.Index(group), price_columns + ['WAPRICE'])
+            if data is None:
+                continue
+            data = data.astype('float64')
+            lp = data[price_columns].bfill(axis=1).iloc[:, 0]
+            wap = lp if engine == 'futures' else data['WAPRICE']
+            prices.append(pd.DataFrame({'BOARDID': board,
+                                        'PRICE': lp if type == 'last' else wap}, index=data.index))
+        if prices:
+            df = pd.concat(prices)
+        else:
+            df = pd.DataFrame(columns=['BOARDID', 'PRICE'])
+        df = df.loc[~df.index.duplicated(keep='first')].reindex(list(tickers))
+        df.index.name = 'SECID'
+        return df
+
+    @staticmethod
+    def _get_infos(tickers, max_workers: int = 8):
+        '''
+        Returns {ticker: get_info()} for the known tickers in order. Tickers missing from
+        security_cache are loaded concurrently, unknown tickers are reported and skipped.
+        '''
+        def load(ticker):
+            try:
+                return Moex(ticker).get_info()
+            except ValueError:
+                print('no_data_for : ', ticker)
+                return None
+
+        tickers = list(dict.fromkeys(tickers))
+        missing = [ticker for ticker in tickers if ticker not in security_cache]
+        loaded = {}
+        if missing:
+            fetch = instrumentation.bind(load)
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(missing)))) as pool:
+                loaded = dict(zip(missing, pool.map(fetch, missing)))
+        infos = {ticker: loaded[ticker] if ticker in loaded else load(ticker) for ticker in tickers}
+        return {ticker: info for ticker, info in infos.items() if info is not None}
+
+    @staticmethod
+    def _merge_snapshot(tables, board: str, index, columns: list):
+        '''
+        Takes every column for the tickers in index from the first board snapshot table that
+        has a row for the ticker, in the priority of _parse_market_data:
+        securities -> marketdata_yields -> marketdata. Price columns are named as in price_columns.
+        Numeric columns come as floats in an object frame, None when no table has any rows.
+        '''
+        frames = []
+        for t in ['securities', 'marketdata_yields', 'marketdata']:
+            if t not in tables or len(tables[t]) == 0:
+                continue
+            frame = tables[t]
+            frame = frame.loc[frame['BOARDID'] == board].set_index('SECID')
+            frames.append(frame.loc[frame.index.isin(index) & ~frame.index.duplicated()])
+        if not frames:
+            return None
+        data = pd.DataFrame(index=index, columns=columns, dtype='object')
+        filled = pd.DataFrame(False, index=index, columns=data.columns)
+        for frame in frames:
+            frame = frame.rename(columns=price_fallback)
+            present = index.isin(frame.index)
+            for col in data.columns.intersection(frame.columns):
+                mask = present & ~filled[col].values
+                values = frame[col].reindex(index)[mask]
+                if pd.api.types.is_numeric_dtype(values.dtype):
+                    values = values.astype('float64')
+                data.loc[mask, col] = values
+                filled[col] = filled[col].values | present
+        return data
+
+    @staticmethod
+    def get_prices_asof(pairs, type: str = 'last', max_workers: int = 8):
+        """
+        Returns prices as of many (ticker, date) pairs, the bulk form of get_price(date).
+        History of every ticker is read once for the whole range its dates span (from
+        Moex.history_store when it is set) and all pairs are answered by one as-of join:
+        a pair gets the last trading day on or before its date within 30 days, with the
+        same CLOSE -> LCURRENTPRICE -> LEGALCLOSEPRICE fallback as get_price.
+        Pairs dated today get current prices as in get_prices.
+
+        Parameters:
+            pairs (pd.DataFrame or list): SECID and DATE columns, or a list of (ticker, date) tuples.
+            type (last or wap): The type of price to be considered. Default: last.
+            max_workers (int): Tickers downloaded at the same time.
+        Returns:
+            pd.DataFrame: The pairs (same index and order) with TRADEDATE, the day the price
+            comes from, and PRICE. Unknown tickers and dates without data get NaN.
+        """
+        if not isinstance(pairs, pd.DataFrame):
+            pairs = pd.DataFrame(list(pairs), columns=['SECID', 'DATE'])
+        df = pd.DataFrame({'SECID': pairs['SECID'].astype(str).to_numpy(dtype='object'),
+                           'DATE': pd.to_datetime(pairs['DATE']).dt.normalize().to_numpy()})
+        today = pd.to_datetime('today').normalize()
+        past = df.loc[df['DATE'] < today]
+        window = pd.Timedelta(days=30)
+
+        def history(ticker, dates):
+            moex = Moex(ticker)
+            try:
+                data = moex._parse_history_results(date_from=(dates.min() - window).date(),
+                                                   date_to=dates.max().date())
+                futures = moex.get_engine() == 'futures'
+            except ValueError:
+                print('no_data_for : ', ticker)
+                return None
+            if len(data) == 0:
+                return None
+            data = data.rename(columns=price_fallback).reindex(columns=['TRADEDATE'] + price_columns + ['WAPRICE'])
+            lp = data[price_columns].astype('float64').bfill(axis=1).iloc[:, 0]
+            wap = lp if futures else data['WAPRICE'].astype('float64')
+            return pd.DataFrame({'SECID': ticker,
+                                 'TRADEDATE': pd.to_datetime(data['TRADEDATE']).to_numpy(dtype='datetime64[ns]'),
+                                 'PRICE': (lp if type == 'last' else wap).to_numpy()})
+
+        fetch = instrumentation.bind(history)
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            frames = list(pool.map(lambda item: fetch(item[0], item[1]['DATE']), past.groupby('SECID')))
+        frames = [x for x in frames if x is not None]
+        prices = pd.concat(frames, ignore_index=True) if frames else \
+            pd.DataFrame({'SECID': pd.Series(dtype='object'), 'TRADEDATE': pd.Series(dtype='datetime64[ns]'),
+                          'PRICE': pd.Series(dtype='float64')})
+        prices['SECID'] = prices['SECID'].astype(str)
+        prices = prices.sort_values(by='TRADEDATE', kind='stable')
+        left = past.reset_index(names='_row').sort_values(by='DATE', kind='stable')
+        left['DATE'] = left['DATE'].astype('datetime64[ns]')
+        left['SECID'] = left['SECID'].astype(str)
+        joined = pd.merge_asof(left, prices, left_on='DATE', right_on='TRADEDATE', by='SECID',
+                               direction='backward', tolerance=window)
+        tradedate = np.full(len(df), np.datetime64('NaT'), dtype='datetime64[ns]')
+        price = np.full(len(df), np.nan)
+        rows = joined['_row'].to_numpy()
+        tradedate[rows] = joined['TRADEDATE'].to_numpy(dtype='datetime64[ns]')
+        price[rows] = joined['PRICE'].to_numpy(dtype='float64')
+        current = df.loc[df['DATE'] >= today]
+        if len(current):
+            now = Moex.get_prices(list(current['SECID'].unique()), type=type)['PRICE']
+            tradedate[current.index] = today.to_datetime64()
+            price[current.index] = now.reindex(current['SECID']).to_numpy(dtype='float64')
+        result = pairs.copy()
+        result['TRADEDATE'] = tradedate
+        result['PRICE'] = price
+        return result
+
     def get_ticker_currency(self):
         '''Returns currency name ticker is traded in'''
         currency = self.get_description(param = 'faceunit')
@@ -299,14 +602,13 @@ class Moex:
         else:
             return None
     
-    def get_dividends(self):
+    def get_dividends(self, columns: list = None):
         '''Returns a list of known dividends for a ticker'''
         try:
             kwargs = {'ticker': self.ticker,
-            'engine' : self.get_engine(),
-            'market' : self.get_market(),
-            'board' : self.get_board(),
-            'table': 'dividends'}
+            **self._board_kwargs(),
+            'table': 'dividends',
+            'columns': columns}
             url = urls['history_dividends'] + '.json'
             df = url_processed(url, **kwargs)
             return df
@@ -315,17 +617,8 @@ class Moex:
             return None
 
     def get_trade_currency(self):
-        '''Returns list of stock exchange boards for a ticker'''
-        kwargs = {'ticker': self.ticker}
-        url = urls['description'] + '.json'
-        response = read_url(url=url,
-                            session=self.session,
-                            **kwargs).json()['boards']
-        try:
-            cur = {key : value for key, value in zip(response['columns'], [i for subset in [s for s in response['data'] if s[response['columns'].index('is_primary')] == 1] for i in subset])}
-            return cur.get('currencyid')            
-        except:
-            raise ValueError(f'ERROR {self.ticker} - unknown ticker')     
+        '''Returns currency of the primary board for a ticker'''
+        return self.get_info()['currency']
         
     def get_coupons(self):        
         '''Returns a schedule of coupon paymnets for a bond:'''
@@ -333,15 +626,17 @@ class Moex:
         'ticker': self.ticker,
         'iss.meta': 'on',
         'limit': 'unlimited',
-        'engine': self.get_engine(),
-        'market': self.get_market(),
-        'board': self.get_board(),
+        **self._board_kwargs(),
         'table': 'coupons'}
         url = urls['bondization'] + '.json'
         df = url_processed(url, **kwargs)
+        return self._process_coupons(df)
+
+    def _process_coupons(self, df):
         # костыль для ошибок данных ММВБ когда есть строки с несуществующими купонами
-        df['valueprc'] = df.apply(lambda x: round(x['value'] / x.facevalue * (365 / (x.coupondate - x.startdate).days), 4) * 100
-        if pd.isnull(x.valueprc) == True and pd.isnull(x.value) == False else x.valueprc, axis=1)
+        fix = df['valueprc'].isnull() & df['value'].notnull()
+        days = (df['coupondate'] - df['startdate']).dt.days
+        df['valueprc'] = df['valueprc'].mask(fix, (df['value'] / df['facevalue'] * (365 / days)).round(4) * 100)
         # # костыль для пустого первого купона флоатера
         if np.isnan(df['valueprc'][0]):
             coupon = self._parse_market_data()['ACCRUEDINT']
@@ -359,37 +654,49 @@ class Moex:
     def get_offers(self):
         '''Returns a schedule of offers for a bond:'''
         kwargs = {'ticker': self.ticker,
-        'engine' : self.get_engine(),
-        'market' : self.get_market(),
-        'board' : self.get_board(),
+        **self._board_kwargs(),
         'table': 'offers'}
         url = urls['bondization'] + '.json'
-        df = url_processed(url, **kwargs).rename(columns={'price': 'offerprice'})
+        df = url_processed(url, **kwargs)
+        return Moex._process_offers(df)
+
+    @staticmethod
+    def _process_offers(df):
+        df = df.rename(columns={'price': 'offerprice'})
         df.fillna({'offerprice': 100}, inplace=True)
         return df
 
     def get_amortization(self):
         '''Returns schedule of redemtion paymnets for a bond:'''
         kwargs = {'ticker': self.ticker,
-        'engine' : self.get_engine(),
-        'market' : self.get_market(),
-        'board' : self.get_board(),
+        **self._board_kwargs(),
         'table': 'amortizations'}
         url = urls['bondization'] + '.json'
         df = url_processed(url, **kwargs)
         return df
     
+    def get_bondization(self):
+        '''Returns coupons, offers and amortizations tables of a bond from one request as a dict'''
+        kwargs = {'ticker': self.ticker,
+                  'meta': 'on',
+                  'limit': 'unlimited',
+                  **self._board_kwargs()}
+        url = urls['bondization'] + '.json'
+        return tables_processed(url, ['coupons', 'offers', 'amortizations'], **kwargs)
+
     def get_bond_schedule(self, till_offer: bool = False, last_coupon: bool = False):
         '''Returns an unprocessed schedule of payments for a bond:
         - coupons
         - amortization payments
         - offers'''
         try:
-            coupons = self.get_coupons()
+            tables = self.get_bondization()
+            coupons = self._process_coupons(tables['coupons'])
             try:
                 if pd.isnull(coupons.loc[coupons['coupondate'] > dt.datetime.now(), 'valueprc'].iloc[0]) == True:        
-                    acc_int = self._parse_market_data()['ACCRUEDINT']
-                    set_date = pd.to_datetime(self._parse_market_data()['SETTLEDATE'])
+                    market_data = self._parse_market_data()
+                    acc_int = market_data['ACCRUEDINT']
+                    set_date = pd.to_datetime(market_data['SETTLEDATE'])
                     c_str = coupons.loc[coupons['coupondate'] > dt.datetime.now()].iloc[0]['startdate'] 
                     c_end = coupons.loc[coupons['coupondate'] > dt.datetime.now()].iloc[0]['coupondate'] 
                     f_v = coupons.loc[coupons['coupondate'] > dt.datetime.now()].iloc[0]['facevalue'] 
@@ -399,97 +706,86 @@ class Moex:
                     coupons.loc[coupons.loc[coupons['coupondate'] > dt.datetime.now()].index[0], 'value'] = coup_sum
             except:
                 pass
-            offers = self.get_offers()
-            amortization = self.get_amortization()
-            # coupons processing
-            coupons.drop(columns={'issuevalue', 'primary_boardid',
-                                  'recorddate', 'startdate', 'value_rub'}, inplace=True, errors='ignore')
-            coupons.rename(columns={'coupondate': 'date',
-                                    'valueprc': 'couponprc',
-                                    'value': 'couponvalue'}, inplace=True)
-            coupons['operationtype'] = 'coupon'
-            # offers processing
-            offers = offers.loc[~offers['offertype'].str.contains('отмен')].reset_index(drop=True)
-            offers.drop(columns={'issuevalue', 'offerdatestart', 'offerdate', 'primary_boardid',
-                        'agent', 'offertype', 'value'}, inplace=True, errors='ignore')
-            offers.rename(columns={'offerdateend': 'date'}, inplace=True)
-            offers['operationtype'] = 'offer'
-            # amortization processing
-            amortization.drop(columns={
-                'issuevalue', 'primary_boardid', 'value_rub'}, inplace=True, errors='ignore')
-            amortization.rename(columns={'amortdate': 'date',
-                                         'data_source': 'operationtype',
-                                         'valueprc': 'redemptionprc',
-                                         'value': 'redemptionvalue'}, inplace=True)
-            if amortization.loc[amortization.index[-1], 'operationtype'] == 'amortization':
-                amortization.loc[amortization.index[-1], 'operationtype'] = 'maturity' 
-            issue_date = {'date': self.get_description(
-                param='issuedate'), 'operationtype': 'issue'}
-            # concatenate issue date / coupons / offers / amortization schedules
-            df = pd.concat([coupons, offers, amortization], ignore_index=True)
-            df.loc[len(df)] = issue_date
-            # sorting by date and operation type (coupon - last) to backfill nan coupon rates
-            mapping = {'issue': 0,
-                       'coupon': 4,
-                       'offer': 1,
-                       'amortization': 2,
-                       'maturity': 3}
-            df['order'] = df['operationtype'].map(mapping)
-            df = df.sort_values(by=['date', 'order']).reset_index(drop=True)
-            for column in ['couponprc']:
-                df[column] = df[column].bfill()
-            df['order'] = df['operationtype'].map(mapping)
-            df = df.sort_values(by=['date', 'order'])
-            df = df.drop(columns=['order']).reset_index(drop=True)
-            # final sorting by date and operation type
-            mapping = {'issue': 0,
-                       'coupon': 1,
-                       'offer': 2,
-                       'amortization': 3,
-                       'maturity': 4}
-            df['order'] = df['operationtype'].map(mapping)
-            df = df.sort_values(by=['date', 'order']).reset_index(drop=True)
-            df = df.drop(columns=['order'])
-            for column in ['isin', 'name', 'initialfacevalue', 'faceunit', 'secid']:
-                df[column] = df[column].fillna(df[column].mode()[0])
-            df.loc[0, 'facevalue'] = df.loc[0, 'initialfacevalue']
-            df.loc[0, 'couponvalue'] = 0
-            for ix in range(1, len(df)):
-                if df.loc[ix-1, 'operationtype'] == 'amortization':
-                    df.loc[ix, 'facevalue'] = df.loc[ix-1, 'facevalue'] - \
-                        df.loc[ix-1, 'redemptionvalue']
-                else:
-                    df.loc[ix, 'facevalue'] = df.loc[ix-1, 'facevalue']
-            if last_coupon:
-                df['couponprc'] = df['couponprc'].ffill()
-            # calculating coupon values as (days from previous coupon date to current date) * (coupon rate) * (face value)
-            df['couponvalue'] = df['couponvalue'].fillna((df['date']
-                                                          - df['date'].shift()).dt.days / 365 * df['couponprc'] / 100 * df['facevalue'])
-            df['couponvalue'] = round(df['couponvalue'], 2)
-            # setting coupon and redemption values to 0 after the next offer date
-            if till_offer:
-                offer_index = df.loc[(df['operationtype'] == 'offer') & (
-                    df['date'] >= dt.datetime.now())].index
-                if offer_index.empty:
-                    pass
-                else:
-                    offer_index = offer_index[0]
-                    df.loc[offer_index, 'redemptionvalue'] = df.loc[offer_index,
-                                                                    'offerprice'] / 100 * df.loc[offer_index, 'facevalue']
-                    df.loc[offer_index+1:, ['couponvalue', 'redemptionvalue']] = 0
-                    df.loc[(df['operationtype'] == 'offer') & (df['date'] < dt.datetime.now()),
-                            ['couponvalue', 'redemptionvalue']] = 0
-            else:
-                df.loc[(df['operationtype'] == 'offer'), [
-                    'couponvalue', 'redemptionvalue']] = 0
-            df['couponvalue'] = [np.nan if pd.isnull(
-                x) == True else y for x, y in zip(df['couponprc'], df['couponvalue'])]
-            df.fillna({'redemptionvalue': 0}, inplace=True)
-            df.fillna({'offerprice': 0}, inplace=True)
-            df.fillna({'redemptionprc': 0}, inplace=True)
-            return df
+            offers = Moex._process_offers(tables['offers'])
+            amortization = tables['amortizations']
+            return Moex._build_schedule(coupons, offers, amortization,
+                                        self.get_description(param='issuedate'),
+                                        till_offer=till_offer,
+                                        last_coupon=last_coupon)
         except:
-            return pd.DataFrame()        
+            return pd.DataFrame()
+
+    @staticmethod
+    def _build_schedule(coupons, offers, amortization, issue_date, till_offer: bool = False, last_coupon: bool = False):
+        '''Merges coupons, offers and amortization tables of one bond into a schedule of payments'''
+        # coupons processing
+        coupons.drop(columns={'issuevalue', 'primary_boardid',
+                              'recorddate', 'startdate', 'value_rub'}, inplace=True, errors='ignore')
+        coupons.rename(columns={'coupondate': 'date',
+                                'valueprc': 'couponprc',
+                                'value': 'couponvalue'}, inplace=True)
+        coupons['operationtype'] = 'coupon'
+        # offers processing
+        offers = offers.loc[~offers['offertype'].str.contains('отмен')].reset_index(drop=True)
+        offers.drop(columns={'issuevalue', 'offerdatestart', 'offerdate', 'primary_boardid',
+                    'agent', 'offertype', 'value'}, inplace=True, errors='ignore')
+        offers.rename(columns={'offerdateend': 'date'}, inplace=True)
+        offers['operationtype'] = 'offer'
+        # amortization processing
+        amortization.drop(columns={
+            'issuevalue', 'primary_boardid', 'value_rub'}, inplace=True, errors='ignore')
+        amortization.rename(columns={'amortdate': 'date',
+                                     'data_source': 'operationtype',
+                                     'valueprc': 'redemptionprc',
+                                     'value': 'redemptionvalue'}, inplace=True)
+        if amortization.loc[amortization.index[-1], 'operationtype'] == 'amortization':
+            amortization.loc[amortization.index[-1], 'operationtype'] = 'maturity' 
+        # concatenate issue date / coupons / offers / amortization schedules
+        df = pd.concat([coupons, offers, amortization], ignore_index=True)
+        df.loc[len(df)] = {'date': issue_date, 'operationtype': 'issue'}
+        # coupon rates are backfilled in (date, coupon - last) order,
+        # the frame itself is sorted once by (date, coupon - right after issue)
+        keys = pd.DataFrame({'date': df['date'],
+                             'order': df['operationtype'].map(schedule_backfill_order)})
+        backfill_index = keys.sort_values(by=['date', 'order'], kind='stable').index
+        df['couponprc'] = df['couponprc'].loc[backfill_index].bfill()
+        keys['order'] = df['operationtype'].map(schedule_order)
+        df = df.loc[keys.sort_values(by=['date', 'order'], kind='stable').index].reset_index(drop=True)
+        for column in ['isin', 'name', 'initialfacevalue', 'faceunit', 'secid']:
+            df[column] = df[column].fillna(df[column].mode()[0])
+        # face value after each row is the initial one less all previous amortization payments
+        redemption = np.where(df['operationtype'].values[:-1] == 'amortization',
+                              df['redemptionvalue'].to_numpy(dtype='float64')[:-1], 0.0)
+        df['facevalue'] = np.subtract.accumulate(np.concatenate([[df.loc[0, 'initialfacevalue']], redemption]))
+        df.loc[0, 'couponvalue'] = 0
+        if last_coupon:
+            df['couponprc'] = df['couponprc'].ffill()
+        # calculating coupon values as (days from previous coupon date to current date) * (coupon rate) * (face value)
+        df['couponvalue'] = df['couponvalue'].fillna((df['date']
+                                                      - df['date'].shift()).dt.days / 365 * df['couponprc'] / 100 * df['facevalue'])
+        df['couponvalue'] = round(df['couponvalue'], 2)
+        # setting coupon and redemption values to 0 after the next offer date
+        if till_offer:
+            offer_index = df.loc[(df['operationtype'] == 'offer') & (
+                df['date'] >= dt.datetime.now())].index
+            if offer_index.empty:
+                pass
+            else:
+                offer_index = offer_index[0]
+                df.loc[offer_index, 'redemptionvalue'] = df.loc[offer_index,
+                                                                'offerprice'] / 100 * df.loc[offer_index, 'facevalue']
+                df.loc[offer_index+1:, ['couponvalue', 'redemptionvalue']] = 0
+                df.loc[(df['operationtype'] == 'offer') & (df['date'] < dt.datetime.now()),
+                        ['couponvalue', 'redemptionvalue']] = 0
+        else:
+            df.loc[(df['operationtype'] == 'offer'), [
+                'couponvalue', 'redemptionvalue']] = 0
+        df['couponvalue'] = df['couponvalue'].where(df['couponprc'].notnull())
+        df.fillna({'redemptionvalue': 0}, inplace=True)
+        df.fillna({'offerprice': 0}, inplace=True)
+        df.fillna({'redemptionprc': 0}, inplace=True)
+        return df
+        
     
     def find_ticker(self, type: str = None):
         """
@@ -508,7 +804,7 @@ class Moex:
                 'limit': 'unlimited',
                 'table': 'securities',
                 'search_ticker' : self.ticker}
-            url = 'https://iss.moex.com/iss/securities' + '.json'
+            url = urls['securities'] + '.json'
             df = url_processed(url, **kwargs)
             if type in ['share', 'bond', 'index', 'future']:
                 return df[df['group'].str.contains(type)].loc[df['is_traded'] == 1].sort_values(by='shortname')
@@ -520,12 +816,11 @@ class Moex:
     @staticmethod
     def get_bonds_list():
         '''Returns a table of all traded bonds at the current time.'''
-        sec = url_processed(urls['bonds_list'] + 'securities' + '.json',
-                            **{'meta': 'on', 'table': 'securities'}).drop(columns='DURATION', errors='ignore')
-        md = url_processed(urls['bonds_list'] + 'securities' + '.json',
-                           **{'meta': 'on', 'table': 'marketdata'}).drop(columns='DURATION', errors='ignore')
-        mdy = url_processed(urls['bonds_list'] + 'securities' + '.json',
-                            **{'meta': 'on', 'table': 'marketdata_yields'})
+        tables = tables_processed(urls['bonds_list'] + 'securities' + '.json',
+                                  ['securities', 'marketdata', 'marketdata_yields'], meta='on')
+        sec = tables['securities'].drop(columns='DURATION', errors='ignore')
+        md = tables['marketdata'].drop(columns='DURATION', errors='ignore')
+        mdy = tables['marketdata_yields']
         [['SECID',
           'BOARDID',
           'PRICE',
@@ -538,16 +833,127 @@ class Moex:
             mdy, how='left', on=['SECID', 'BOARDID'])
         board_groups = [58, 193, 207, 245]
 
-        boards = read_url(urls['bonds_list'] + 'boards' + '.json',
-                          **{'meta': 'off', 'table': 'boards'}).json()['boards']['data']
+        boards = decode(read_url(urls['bonds_list'] + 'boards' + '.json',
+                                 **{'meta': 'off', 'table': 'boards'}))['boards']['data']
         boards = [b[2] for b in boards if b[1] in board_groups]
         b_list = b_list.loc[b_list.BOARDID.isin(boards)]
         return b_list
+
+    @staticmethod
+    def get_board_history(date,
+                          engine: str = 'stock',
+                          market: str = 'bonds',
+                          board: str = 'TQCB',
+                          tables: list = None,
+                          columns: list = None):
+        """
+        Retrieves daily trading results of every security on a board for one trade date,
+        in one paginated sweep per table instead of a request series per ticker.
+
+        Args:
+            date (str): The trade date in 'YYYY-MM-DD' format.
+            engine, market, board (str): The board, e.g. 'stock', 'shares', 'TQBR'.
+            tables (list, optional): 'history' and/or 'history_yields'. Defaults to both on
+                                     the bonds market and to 'history' elsewhere.
+            columns (list, optional): Columns to request from ISS. Defaults to all columns.
+        Returns:
+            dict: {table: pd.DataFrame}.
+        """
+        if tables is None:
+            tables = ['history', 'history_yields'] if market == 'bonds' else ['history']
+        elif isinstance(tables, str):
+            tables = [tables]
+        kwargs = {'engine': engine,
+                  'market': market,
+                  'board': board,
+                  'iss.meta': 'on',
+                  'limit': 'unlimited',
+                  'date': date,
+                  'columns': columns}
+        return {table: mfunc.concat_frames(iter_processed(urls['board_' + table] + '.json', table, **kwargs))
+                for table in tables}
+
+    @staticmethod
+    def get_board_history_range(date_from,
+                                date_to = None,
+                                engine: str = 'stock',
+                                market: str = 'bonds',
+                                board: str = 'TQCB',
+                                tables: list = None,
+                                columns: list = None,
+                                output: str = None,
+                                format: str = 'pickle',
+                                max_workers: int = 4):
+        """
+        Runs get_board_history for every weekday of a range, several dates at a time.
+
+        Args:
+            date_from, date_to (str): The range in 'YYYY-MM-DD' format, date_to defaults to today.
+            engine, market, board, tables, columns: As in get_board_history.
+            output (str, optional): Directory to write every date to as <output>/<table>/<date>.pkl
+                                    (or .parquet) as soon as it arrives. Dates already written are skipped,
+                                    so an interrupted backfill resumes where it stopped.
+            format (str): 'pickle' or 'parquet' (needs pyarrow).
+            max_workers (int): Dates downloaded at the same time.
+        Returns:
+            dict: {table: pd.DataFrame} of the whole range, or {table: [written files]} with output.
+            Dates that failed are printed and listed as (date, date, error) in
+            df.attrs['failed_ranges'] (without output).
+        """
+        date_to = dt.datetime.now().date() if date_to == None else date_to
+        dates = [str(x.date()) for x in pd.bdate_range(date_from, date_to)]
+        if tables is None:
+            tables = ['history', 'history_yields'] if market == 'bonds' else ['history']
+        elif isinstance(tables, str):
+            tables = [tables]
+        ext = '.parquet' if format == 'parquet' else '.pkl'
+        path = lambda table, date: os.path.join(output, table, date + ext)
+        if output is not None:
+            for table in tables:
+                os.makedirs(os.path.join(output, table), exist_ok=True)
+            dates = [d for d in dates if not all(os.path.exists(path(t, d)) for t in tables)]
+        fetch = instrumentation.bind(lambda date: Moex.get_board_history(date, engine, market, board, tables, columns))
+        results = {table: [] for table in tables}
+        failed = []
+        pending = deque()
+        dates = iter(dates)
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            # a few dates are queued ahead, finished ones are written out and released
+            for date in itertools.islice(dates, 2 * max(1, max_workers)):
+                pending.append((date, pool.submit(fetch, date)))
+            while pending:
+                date, future = pending.popleft()
+                following = next(dates, None)
+                if following is not None:
+                    pending.append((following, pool.submit(fetch, following)))
+                try:
+                    frames = future.result()
+                except (requests.RequestException, ValueError) as e:
+                    failed.append((date, date, repr(e)))
+                    continue
+                for table, df in frames.items():
+                    if output is None:
+                        results[table].append(df)
+                    elif len(df) > 0:
+                        if format == 'parquet':
+                            df.to_parquet(path(table, date))
+                        else:
+                            df.to_pickle(path(table, date))
+                        results[table].append(path(table, date))
+        if failed:
+            print(f'{board} board history: failed to download ' + ', '.join(a for a, _, _ in failed))
+        if output is not None:
+            return results
+        for table, frames in results.items():
+            results[table] = mfunc.concat_frames(frames) if frames else pd.DataFrame()
+            results[table].attrs['failed_ranges'] = failed
+        return results
     
     def get_candles(self,
                     date_from: str = None,
                     date_to: str = None,
-                    interval : int = 24):
+                    interval : int = 24,
+                    columns: list = None):
         """
         Retrieves candle data for a given ticker within a specified date range and interval.
 
@@ -557,27 +963,107 @@ class Moex:
             date_to (str, optional): The end date for the data retrieval in 'YYYY-MM-DD' format. 
                                      Defaults to the current date if not provided.
             interval (int, optional): The interval for the candle data. Default is 24.
+            columns (list, optional): Columns to request from ISS. Defaults to all columns.
+
+        Coarser intervals are aggregated locally from finer bars (see candle_aggregation)
+        when Moex.candle_base is set or Moex.history_store already holds finer bars for the range.
 
         Returns:
             pd.DataFrame: A DataFrame containing the candle data.
         """
         date_from = (dt.datetime.now() - dt.timedelta(days=30)).date() if date_from == None else date_from
         date_to = dt.datetime.now().date() if date_to == None else date_to
-        table = 'candles'
-        kwargs = {
-        'ticker': self.ticker,
-        'iss.meta': 'on',
-        'limit': 'unlimited',    
-        'engine' : self.get_engine(),
-        'market' : self.get_market(),
-        'board' : self.get_board(),
-        'date_from': date_from,
-        'date_to': date_to,
-        'table': table,
-        'interval' : interval}
-        url = urls[table] + '.json'
-        df = url_processed(url, **kwargs)
-        return df
+        base = self._candle_base(interval, date_from, date_to)
+        if base is not None:
+            df = aggregate_candles(self.get_candles(date_from, date_to, base), interval)
+            return df if columns is None else df[list(columns)]
+        if Moex.history_store is not None:
+            fetch = lambda a, b: self._download_candles(a, b, interval)
+            df = Moex.history_store.read(self.ticker, self.get_board(), interval, date_from, date_to,
+                                         fetch, date_col='begin')
+            return df if columns is None else df[list(columns)]
+        return self._download_candles(date_from, date_to, interval, columns=columns)
+
+    def _candle_base(self, interval, date_from, date_to):
+        '''
+        Returns the finer interval to aggregate candles of interval from, or None to request them:
+        Moex.candle_base, otherwise the coarsest finer interval that history_store holds for
+        the whole range up to yesterday (today is always downloaded).
+        '''
+        if Moex.candle_base is not None:
+            return Moex.candle_base if can_derive(Moex.candle_base, interval) else None
+        if Moex.history_store is None or interval not in interval_order:
+            return None
+        yesterday = dt.datetime.now().date() - dt.timedelta(days=1)
+        date_to = min(pd.to_datetime(date_to).date(), yesterday)
+        if pd.to_datetime(date_from).date() > date_to:
+            return None
+        for base in reversed(interval_order[:interval_order.index(interval)]):
+            if Moex.history_store.covers(self.ticker, self.get_board(), base, date_from, date_to):
+                return base
+        return None
+
+    def _download_candles(self, date_from, date_to, interval, columns: list = None):
+        return self._download_sharded('candles', date_from, date_to, columns=columns, interval=interval)
+
+    def iter_candles(self,
+                     date_from: str = None,
+                     date_to: str = None,
+                     interval: int = 24,
+                     columns: list = None,
+                     window: int = None,
+                     prefetch: int = 4):
+        """
+        Streams candles as typed DataFrame chunks instead of one frame, so e.g. years
+        of 1-minute candles are read with constant memory.
+
+        Args:
+            date_from (str, optional): The start date in 'YYYY-MM-DD' format. Defaults to 30 days ago.
+            date_to (str, optional): The end date in 'YYYY-MM-DD' format. Defaults to today.
+            interval (int, optional): The interval for the candle data. Default is 24.
+            columns (list, optional): Columns to request from ISS. Defaults to all columns.
+            window (int, optional): Yield one chunk per window of this many days instead of one per page.
+            prefetch (int): Pages requested ahead of the consumer.
+        Yields:
+            pd.DataFrame: Consecutive chunks of the candles table.
+        Example:
+            for chunk in Moex('SBER').iter_candles('2015-01-01', interval=1, window=30):
+                ...
+        """
+        date_from = (dt.datetime.now() - dt.timedelta(days=30)).date() if date_from == None else date_from
+        date_to = dt.datetime.now().date() if date_to == None else date_to
+        return self._iter_table('candles', date_from, date_to, columns=columns, window=window,
+                                prefetch=prefetch, interval=interval)
+
+    @staticmethod
+    def sync(tickers, interval = 'history', date_from: str = None):
+        """
+        Brings Moex.history_store up to date for a list of tickers.
+        Only dates after the last downloaded range are requested.
+
+        Args:
+            tickers (list): A list of tickers.
+            interval (int or 'history'): A candle interval or 'history' for daily trading results.
+            date_from (str, optional): Start date for tickers that are not in the store yet.
+                                       Defaults to the first history date of the primary board.
+        """
+        if Moex.history_store is None:
+            raise ValueError('Moex.history_store is not set')
+        date_to = dt.datetime.now().date()
+        for ticker in tickers:
+            moex = Moex(ticker)
+            last = Moex.history_store.last_date(ticker, moex.get_board(), interval)
+            if last is not None:
+                start = last
+            elif date_from is not None:
+                start = date_from
+            else:
+                boards = moex.get_info()['boards']
+                start = boards.loc[boards['is_primary'] == 1, 'history_from'].iloc[0] or date_to
+            if interval == 'history':
+                moex._parse_history_results(date_from=start, date_to=date_to)
+            else:
+                moex.get_candles(date_from=start, date_to=date_to, interval=interval)
 
     @staticmethod
     def get_indices_groups(name: str = None):
@@ -616,30 +1102,58 @@ class Moex:
         df = url_processed(urls['indices'] + '.json', **kwargs)
         return df
 
+    @staticmethod
+    def _archived_zcurve(date):
+        '''
+        Returns archived curve params as of a past date, syncing the archive once a day when
+        the date is newer than its last trade date. None when the date is before the archive.
+        '''
+        archive = Moex.zcurve_archive
+        date = pd.to_datetime(date).normalize()
+        today = pd.to_datetime('today').normalize()
+        if (archive.last_date is None or date > archive.last_date) and archive.synced != today:
+            Moex.sync_zcurve()
+        p = archive.asof(date)
+        if p is None and len(archive):
+            print('error, min date: ', pd.Timestamp(archive.dates[0]).date())
+        return p
+
+    @staticmethod
+    def _parse_zcurve_params(table):
+        zcyz_params = pd.DataFrame(table['data'], columns=table['columns'])
+        zcyz_params.columns = zcyz_params.columns.str.lower()
+        return zcyz_params.rename(columns={'b1': 'b0', 'b2': 'b1', 'b3': 'b2'})
+
     @staticmethod
     def get_zcurve_params(date = None):
-        df = read_url(urls['zcyz'] + '.json', date=date).json()
+        if Moex.zcurve_archive is not None and date is not None \
+                and pd.to_datetime(date) < pd.to_datetime('today').normalize():
+            return Moex._archived_zcurve(date)
+        df = decode(read_url(urls['zcyz'] + '.json', date=date))
         min_date = pd.to_datetime(df['params.dates']['data'][0][0]) 
         if date == None:
             date = pd.to_datetime('today').normalize()
         if pd.to_datetime(date) < min_date:
             print('error, min date: ', min_date.date())
             return None  
-        df = df['params']
-        zcyz_params = pd.DataFrame(df['data'], columns=df['columns'])
-        zcyz_params.columns = zcyz_params.columns.str.lower()
-        zcyz_params = zcyz_params.rename(columns={'b1': 'b0', 'b2': 'b1', 'b3': 'b2'})
-        return zcyz_params
+        return Moex._parse_zcurve_params(df['params'])
 
     @staticmethod
     def get_zcurve_params_history():
         """
         Fetches and processes the zero-coupon yield curve parameters history from the Moscow Exchange.
+        With Moex.zcurve_archive set, only trade dates missing from the archive are downloaded.
         Returns:
             pd.DataFrame: A DataFrame containing the processed zero-coupon yield curve parameters history.
         """
-        url = "http://moex.com/iss/downloads/engines/stock/zcyc/dynamic.csv.zip"
-        response = read_url(url)
+        if Moex.zcurve_archive is not None:
+            Moex.sync_zcurve()
+            return Moex.zcurve_archive.params.copy()
+        return Moex._download_zcurve_archive()
+
+    @staticmethod
+    def _download_zcurve_archive():
+        response = read_url(urls['zcyc_archive'])
         with ZipFile(BytesIO(response.content)) as zip_file:
             with zip_file.open(zip_file.namelist()[0]) as file:
                 df = pd.read_csv(file, sep=';', decimal=',', skiprows=1)
@@ -648,6 +1162,41 @@ class Moex:
                 df['tradedate'] = pd.to_datetime(df['tradedate'], format='%d.%m.%Y')
         return df
 
+    @staticmethod
+    def sync_zcurve(max_requests: int = 10):
+        """
+        Adds trade dates missing from Moex.zcurve_archive. Today is never archived because
+        the curve changes during the session.
+        An empty archive, or one more than max_requests trade dates behind, is filled from
+        the full history file, otherwise only the missing dates are requested from zcyc.
+
+        Returns:
+            int: The number of trade dates added.
+        """
+        archive = Moex.zcurve_archive
+        if archive is None:
+            raise ValueError('Moex.zcurve_archive is not set')
+        today = pd.to_datetime('today').normalize()
+        response = decode(read_url(urls['zcyz'] + '.json', table='params,params.dates'))
+        till = min(pd.to_datetime(response['params.dates']['data'][0][1]), today - pd.Timedelta(days=1))
+        frames = [Moex._parse_zcurve_params(response['params'])]
+        if archive.last_date is None:
+            frames.append(Moex._download_zcurve_archive())
+        else:
+            missing = pd.bdate_range(archive.last_date + pd.Timedelta(days=1), till)
+            if len(missing) > max_requests:
+                history = Moex._download_zcurve_archive()
+                frames.append(history.loc[history['tradedate'] > archive.last_date])
+            else:
+                for date in missing:
+                    response = decode(read_url(urls['zcyz'] + '.json', date=date.date(), table='params'))
+                    frames.append(Moex._parse_zcurve_params(response['params']))
+        df = pd.concat(frames, ignore_index=True)
+        df = df.loc[pd.to_datetime(df['tradedate']) < today]
+        added = archive.update(df) if len(df) else 0
+        archive.synced = today
+        return added
+
     @staticmethod
     def get_zcurve_prices(date = None):
         """
@@ -660,7 +1209,17 @@ class Moex:
         Returns:
                 DataFrame or None: A DataFrame containing the zero-coupon yield curve prices or None if an error occurs.
         """
-        df = read_url(urls['zcyz'] + '.json', date=date).json()
+        if Moex.zcurve_archive is not None and date is not None \
+                and pd.to_datetime(date) < pd.to_datetime('today').normalize():
+            p = Moex._archived_zcurve(date)
+            if p is None:
+                return None
+            periods = np.array(zcyc_periods)
+            return pd.DataFrame({'tradedate': p['tradedate'].iloc[0],
+                                 'tradetime': p['tradetime'].iloc[0] if 'tradetime' in p.columns else None,
+                                 'period': periods,
+                                 'value': Moex.calculate_zyield(p.iloc[0], periods).round(2)})
+        df = decode(read_url(urls['zcyz'] + '.json', date=date))
         min_date = pd.to_datetime(df['params.dates']['data'][0][0]) 
         if date == None:
             date = pd.to_datetime('today')   
@@ -680,26 +1239,14 @@ class Moex:
 
         Parameters:
             p (DataFrame): A pandas DataFrame containing the necessary financial data.
-            t (float): A time parameter used in the calculation.
+            t (float or array): A time parameter used in the calculation.
+                                For whole grids of dates and maturities use zcurve.ZCurve.
 
         Returns:
             float: The calculated yield.
         """
-        def func_a(k):
-            s = [0, 0.6]
-            for i in range(2,9):
-                next = s[-1] + s[1]*k**(i-1)
-                s.append(next)
-            return s
-        k = 1.6
-        a = func_a(k)
-        b = [0.6*k**i for i in range(0,9)]
-        g = p.iloc[-9:]
-        dl = sum([g.iloc[i] * np.exp( -(t - a[i])**2 / b[i]**2 ) for i in range(0,9)])
-        dr = p.b0 + (p.b1 + p.b2) * (p.t1 / t) * (1- np.exp(-t/p.t1)) - p.b2 * np.exp(-t/p.t1)
-        g_t = dl + dr
+        g_t = zcurve.g_curve(p.b0, p.b1, p.b2, p.t1, p.iloc[-9:].to_numpy(dtype='float64'), t)
         y_t = 10000 * (np.exp(g_t/10000) -1)
-        d_t = 1 / (1+ y_t/10000)**t
         return y_t / 100
 
     @staticmethod
@@ -719,4 +1266,57 @@ class Moex:
             print(f'No data for {date}')
             return None
         p = pd.Series(p.iloc[0], index=p.columns)
-        return Moex.calculate_zyield(p, t)
\ No newline at end of file
+        return Moex.calculate_zyield(p, t)
+
+    async def _acall(self, method, *args, **kwargs):
+        return await Moex.async_reader.call(getattr(self, method), *args, **kwargs)
+
+    async def aget_price(self, date: str = None, type: str = 'last'):
+        '''Async version of get_price'''
+        return await self._acall('get_price', date=date, type=type)
+
+    async def aget_candles(self, date_from: str = None, date_to: str = None, interval: int = 24, columns: list = None):
+        '''Async version of get_candles'''
+        return await self._acall('get_candles', date_from=date_from, date_to=date_to, interval=interval, columns=columns)
+
+    async def aget_coupons(self):
+        '''Async version of get_coupons'''
+        return await self._acall('get_coupons')
+
+    async def aget_offers(self):
+        '''Async version of get_offers'''
+        return await self._acall('get_offers')
+
+    async def aget_amortization(self):
+        '''Async version of get_amortization'''
+        return await self._acall('get_amortization')
+
+    async def aget_bond_schedule(self, till_offer: bool = False, last_coupon: bool = False):
+        '''Async version of get_bond_schedule'''
+        return await self._acall('get_bond_schedule', till_offer=till_offer, last_coupon=last_coupon)
+
+    async def aget_dividends(self, columns: list = None):
+        '''Async version of get_dividends'''
+        return await self._acall('get_dividends', columns=columns)
+
+    async def aget_history(self, date_from: str = None, date_to: str = None, columns: list = None):
+        '''Async version of _parse_history_results'''
+        return await self._acall('_parse_history_results', date_from=date_from, date_to=date_to, columns=columns)
+
+    @staticmethod
+    async def gather(method: str, tickers, *args, return_exceptions: bool = False, **kwargs):
+        """
+        Calls a Moex getter for many tickers concurrently.
+
+        Args:
+            method (str): Name of a Moex method, e.g. 'get_candles' or 'get_bond_schedule'.
+            tickers (list): A list of tickers.
+            return_exceptions (bool): If True, failed tickers map to their exception.
+            *args, **kwargs: Passed to the method.
+        Returns:
+            dict: {ticker: result of the method}.
+        Example:
+            asyncio.run(Moex.gather('get_candles', ['SBER', 'GAZP'], interval=24))
+        """
+        func = lambda ticker: getattr(Moex(ticker), method)(*args, **kwargs)
+        return await Moex.async_reader.gather(func, tickers, return_exceptions=return_exceptions)
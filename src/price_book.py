@@ -0,0 +1,164 @@
+import time
+import threading
+
+import numpy as np
+import pandas as pd
+import requests
+
+from url_reader import tables_processed
+from moex_reader import Moex, urls, price_columns
+
+# boards loaded when no boards are given: main shares board, OFZ and corporate bonds
+default_boards = [('stock', 'shares', 'TQBR'),
+                  ('stock', 'bonds', 'TQOB'),
+                  ('stock', 'bonds', 'TQCB')]
+# snapshot columns a book keeps, price columns are named as in moex_reader.price_columns
+book_columns = price_columns + ['WAPRICE', 'ACCRUEDINT', 'EFFECTIVEYIELD', 'YIELD', 'FACEUNIT', 'CURRENCYID']
+
+
+class PriceBook:
+    '''
+    In-process price server over board snapshots (the securities, marketdata and
+    marketdata_yields tables get_prices and get_bonds_list read).
+    Every field is one NumPy array with a row per security, SECID -> row is a dict, so
+    a lookup is a dict get and an array index. Each array ends with a sentinel row
+    (NaN or None) that unknown tickers are pointed at. A refresh builds new arrays and
+    swaps them in at once, so readers never see a half-updated book.
+    - boards: (engine, market, board) tuples, a SECID listed on several boards is served
+      from the first of them
+    - refresh_interval: seconds between refreshes of the background thread (see start)
+
+    Example:
+        book = PriceBook(refresh_interval=30).start()
+        book.last('SBER'), book.accrued(['RU000A0JX0J2', 'SU26238RMFS4'])
+    '''
+
+    fields = ['last', 'wap', 'accrued', 'yield', 'currency', 'board']
+
+    def __init__(self, boards=None, refresh_interval: float = 60, load: bool = True):
+        self.boards = [tuple(board) for board in (boards or default_boards)]
+        self.refresh_interval = refresh_interval
+        self.updated = None
+        self.error = None
+        # (SECID -> row, arrays) replaced as one object on refresh
+        self._book = ({}, self._empty())
+        self._stop = threading.Event()
+        self._thread = None
+        if load:
+            self.refresh()
+
+    @staticmethod
+    def _empty():
+        arrays = {field: np.array([np.nan]) for field in ['last', 'wap', 'accrued', 'yield']}
+        arrays.update({field: np.array([None], dtype='object') for field in ['secid', 'currency', 'board']})
+        return arrays
+
+    def _load_board(self, engine, market, board):
+        tables = tables_processed(urls['board_securities'] + '.json',
+                                  ['securities', 'marketdata', 'marketdata_yields'],
+                                  session=Moex.session, cache=False,
+                                  engine=engine, market=market, board=board, meta='on')
+        secids = [df.loc[df['BOARDID'] == board, 'SECID'] for df in tables.values() if len(df)]
+        index = pd.Index(pd.concat(secids).unique() if secids else [], dtype='object')
+        data = Moex._merge_snapshot(tables, board, index, book_columns)
+        if data is None:
+            return None
+        prices = data[price_columns].astype('float64').bfill(axis=1).iloc[:, 0].to_numpy()
+        currency = data['FACEUNIT'].where(data['FACEUNIT'].notna(), data['CURRENCYID'])
+        return {'secid': index.to_numpy(dtype='object'),
+                'last': prices,
+                'wap': prices if engine == 'futures' else data['WAPRICE'].astype('float64').to_numpy(),
+                'accrued': data['ACCRUEDINT'].astype('float64').to_numpy(),
+                'yield': data['EFFECTIVEYIELD'].fillna(data['YIELD']).astype('float64').to_numpy(),
+                'currency': currency.replace('SUR', 'RUB').to_numpy(dtype='object'),
+                'board': np.full(len(index), board, dtype='object')}
+
+    def refresh(self):
+        '''Reloads every board with one request each and swaps the new arrays in'''
+        parts = [part for part in (self._load_board(*board) for board in self.boards) if part is not None]
+        empty = self._empty()
+        arrays = {field: np.concatenate([part[field] for part in parts] + [empty[field]]) for field in empty}
+        index = {}
+        for row, secid in enumerate(arrays['secid'][:-1]):
+            index.setdefault(secid, row)
+        self._book = (index, arrays)
+        self.updated = time.time()
+        return self
+
+    def start(self):
+        '''Starts the background thread refreshing the book every refresh_interval seconds'''
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='PriceBook', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.refresh_interval):
+            try:
+                self.refresh()
+                self.error = None
+            except (requests.RequestException, ValueError, KeyError) as e:
+                # the previous snapshot keeps being served
+                self.error = e
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def __len__(self):
+        return len(self._book[0])
+
+    def __contains__(self, ticker):
+        return ticker in self._book[0]
+
+    def lookup(self, field: str, tickers):
+        '''
+        Value of field for a ticker, or an array of values for a list of tickers.
+        Unknown tickers get NaN (None for currency and board).
+        '''
+        index, arrays = self._book
+        values = arrays[field]
+        if isinstance(tickers, str):
+            return values[index.get(tickers, -1)]
+        rows = np.fromiter((index.get(ticker, -1) for ticker in tickers), dtype='int64')
+        return values[rows]
+
+    def last(self, tickers):
+        '''Last price with the get_price fallback: LAST -> CLOSE -> LCURRENTPRICE -> LEGALCLOSEPRICE'''
+        return self.lookup('last', tickers)
+
+    def wap(self, tickers):
+        '''Weighted average price'''
+        return self.lookup('wap', tickers)
+
+    def accrued(self, tickers):
+        '''Accrued coupon interest of bonds'''
+        return self.lookup('accrued', tickers)
+
+    def yields(self, tickers):
+        '''Effective yield of bonds in %'''
+        return self.lookup('yield', tickers)
+
+    def currency(self, tickers):
+        '''Face value currency (SUR shown as RUB)'''
+        return self.lookup('currency', tickers)
+
+    def board(self, tickers):
+        return self.lookup('board', tickers)
+
+    def get(self, ticker: str):
+        '''All fields of one ticker as a dict, None for unknown tickers'''
+        index, arrays = self._book
+        row = index.get(ticker)
+        if row is None:
+            return None
+        return {field: arrays[field][row] for field in self.fields}
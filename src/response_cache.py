@@ -0,0 +1,272 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import datetime as dt
+from urllib.parse import urlencode
+
+import requests
+
+
+class CacheMiss(Exception):
+    '''Raised in offline mode when a response is not in the cache'''
+
+
+def default_ttl(url: str, params: dict):
+    '''
+    Returns how long a response may be served from the cache:
+    None - forever, 0 - never cached, otherwise seconds.
+    - history, candles and zcyc for dates entirely in the past never change
+    - market data snapshots live for a minute
+    - bondization, dividends and the curve archive are refreshed daily
+    '''
+    today = dt.date.today().isoformat()
+    till = params.get('till') or params.get('date')
+    if '/history/' in url or url.endswith('/candles.json') or '/zcyc' in url:
+        if till is not None and str(till)[:10] < today:
+            return None
+        return 600
+    if '/bondization/' in url or '/dividends' in url or url.endswith('.zip'):
+        return 86400
+    if '/boards/' in url and '/securities' in url:
+        return 60
+    return 3600
+
+
+class SQLiteBackend:
+    '''Stores cached responses in one SQLite file'''
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('CREATE TABLE IF NOT EXISTS entries ('
+                           'key TEXT PRIMARY KEY, url TEXT, body BLOB, headers TEXT, '
+                           'stored REAL, ttl REAL, accessed REAL, size INTEGER)')
+        self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute('SELECT url, body, headers, stored, ttl FROM entries WHERE key = ?',
+                                     (key,)).fetchone()
+        if row is None:
+            return None
+        return {'url': row[0], 'body': row[1], 'headers': json.loads(row[2]),
+                'stored': row[3], 'ttl': row[4]}
+
+    def set(self, key, entry):
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                               (key, entry['url'], entry['body'], json.dumps(entry['headers']),
+                                entry['stored'], entry['ttl'], time.time(), len(entry['body'])))
+            self._conn.commit()
+
+    def touch(self, key, stored=None):
+        with self._lock:
+            if stored is None:
+                self._conn.execute('UPDATE entries SET accessed = ? WHERE key = ?', (time.time(), key))
+            else:
+                self._conn.execute('UPDATE entries SET accessed = ?, stored = ? WHERE key = ?',
+                                   (time.time(), stored, key))
+            self._conn.commit()
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+            self._conn.commit()
+
+    def sizes(self):
+        '''Returns [(key, size)] from least to most recently used'''
+        with self._lock:
+            return self._conn.execute('SELECT key, size FROM entries ORDER BY accessed').fetchall()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM entries')
+            self._conn.commit()
+
+
+class FileBackend:
+    '''Stores every cached response as <key>.body and <key>.json in a directory'''
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key, ext):
+        return os.path.join(self.directory, key + ext)
+
+    def get(self, key):
+        try:
+            with open(self._path(key, '.json'), 'r') as f:
+                entry = json.load(f)
+            with open(self._path(key, '.body'), 'rb') as f:
+                entry['body'] = f.read()
+        except (OSError, ValueError):
+            return None
+        return entry
+
+    def set(self, key, entry):
+        meta = {k: v for k, v in entry.items() if k != 'body'}
+        with self._lock:
+            with open(self._path(key, '.body'), 'wb') as f:
+                f.write(entry['body'])
+            with open(self._path(key, '.json'), 'w') as f:
+                json.dump(meta, f)
+
+    def touch(self, key, stored=None):
+        if stored is not None:
+            entry = self.get(key)
+            if entry is not None:
+                entry['stored'] = stored
+                self.set(key, entry)
+        try:
+            os.utime(self._path(key, '.json'))
+        except OSError:
+            pass
+
+    def delete(self, key):
+        with self._lock:
+            for ext in ['.json', '.body']:
+                try:
+                    os.remove(self._path(key, ext))
+                except OSError:
+                    pass
+
+    def sizes(self):
+        '''Returns [(key, size)] from least to most recently used'''
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            key = name[:-len('.json')]
+            try:
+                accessed = os.path.getmtime(self._path(key, '.json'))
+                size = os.path.getsize(self._path(key, '.body'))
+            except OSError:
+                continue
+            entries.append((accessed, key, size))
+        return [(key, size) for _, key, size in sorted(entries)]
+
+    def clear(self):
+        for key, _ in self.sizes():
+            self.delete(key)
+
+
+class ResponseCache:
+    '''
+    Response cache used by url_reader.read_url.
+    - backend: SQLiteBackend or FileBackend
+    - ttl: callable (url, params) -> seconds, None for permanent, 0 to bypass the cache
+    - max_size: size cap in bytes; once it is crossed the least recently used entries are
+      evicted down to evict_to of it, so the backend is scanned only once per many writes
+    - offline: serve only from the cache (stale entries included), raise CacheMiss otherwise
+    Stale entries carrying ETag/Last-Modified are revalidated with a conditional request.
+    '''
+
+    def __init__(self, backend, ttl=default_ttl, max_size: int = 1024 ** 3, offline: bool = False,
+                 evict_to: float = 0.9):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_size = max_size
+        self.evict_to = evict_to
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        # guards the counters and the running size, the cache is shared by prefetch threads
+        self._lock = threading.Lock()
+        # total size of the stored bodies, read from the backend on the first write
+        self._size = None
+
+    def _count(self, hits=0, misses=0, revalidated=0):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+            self.revalidated += revalidated
+
+    @staticmethod
+    def make_key(url: str, params: dict):
+        params = sorted((k, str(v)) for k, v in params.items() if v is not None)
+        return hashlib.sha256((url + '?' + urlencode(params)).encode()).hexdigest()
+
+    @staticmethod
+    def _response(entry, source='hit'):
+        '''Rebuilds a stored response, from_cache tells instrumentation how it was served'''
+        response = requests.Response()
+        response._content = entry['body']
+        response.status_code = 200
+        response.url = entry['url']
+        response.headers.update(entry['headers'])
+        response.from_cache = source
+        return response
+
+    def get(self, session, url: str, params: dict, **kwargs):
+        '''Returns a cached response or performs session.get and stores the result'''
+        ttl = self.ttl(url, params)
+        if ttl == 0 and not self.offline:
+            return session.get(url, params=params, **kwargs)
+        key = self.make_key(url, params)
+        entry = self.backend.get(key)
+        now = time.time()
+        if entry is not None and (self.offline or entry['ttl'] is None or now - entry['stored'] < entry['ttl']):
+            self._count(hits=1)
+            self.backend.touch(key)
+            return self._response(entry)
+        if self.offline:
+            self._count(misses=1)
+            raise CacheMiss(url)
+        headers = dict(kwargs.pop('headers', None) or {})
+        if entry is not None:
+            if 'ETag' in entry['headers']:
+                headers['If-None-Match'] = entry['headers']['ETag']
+            if 'Last-Modified' in entry['headers']:
+                headers['If-Modified-Since'] = entry['headers']['Last-Modified']
+        response = session.get(url, params=params, headers=headers, **kwargs)
+        if entry is not None and response.status_code == 304:
+            self._count(hits=1, revalidated=1)
+            self.backend.touch(key, stored=now)
+            return self._response(entry, 'revalidated')
+        self._count(misses=1)
+        response.from_cache = 'miss'
+        if response.status_code == 200:
+            keep = {k: response.headers[k] for k in ['ETag', 'Last-Modified', 'Content-Type']
+                    if k in response.headers}
+            self.backend.set(key, {'url': response.url,
+                                   'body': response.content,
+                                   'headers': keep,
+                                   'stored': now,
+                                   'ttl': ttl})
+            self._stored(len(response.content) - (len(entry['body']) if entry is not None else 0))
+        return response
+
+    def _stored(self, added):
+        '''Adds a write to the running size and evicts when it crosses max_size'''
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size in self.backend.sizes())
+            else:
+                self._size += added
+            if self._size > self.max_size:
+                self._evict()
+
+    def _evict(self):
+        sizes = self.backend.sizes()
+        total = sum(size for _, size in sizes)
+        for key, size in sizes:
+            if total <= self.max_size * self.evict_to:
+                break
+            self.backend.delete(key)
+            total -= size
+        self._size = total
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'revalidated': self.revalidated}
+
+    def clear(self):
+        with self._lock:
+            self.backend.clear()
+            self._size = 0
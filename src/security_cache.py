@@ -0,0 +1,52 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+class SecurityCache:
+    '''
+    Process-wide cache of security metadata records keyed by ticker.
+    Entries expire after ``ttl`` seconds; when ``maxsize`` is exceeded
+    the least recently used ticker is evicted.
+    '''
+
+    def __init__(self, ttl: float = 3600, maxsize: int = 4096):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, ticker: str, loader):
+        '''Returns a cached record for a ticker, calling loader(ticker) on a miss'''
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(ticker)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._data.move_to_end(ticker)
+                return entry[1]
+        record = loader(ticker)
+        with self._lock:
+            self._data[ticker] = (now, record)
+            self._data.move_to_end(ticker)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return record
+
+    def invalidate(self, ticker: str = None):
+        '''Drops one ticker or, if ticker is None, the whole cache'''
+        with self._lock:
+            if ticker is None:
+                self._data.clear()
+            else:
+                self._data.pop(ticker, None)
+
+    def __contains__(self, ticker):
+        with self._lock:
+            entry = self._data.get(ticker)
+            return entry is not None and time.monotonic() - entry[0] < self.ttl
+
+    def __len__(self):
+        return len(self._data)
+
+
+security_cache = SecurityCache()
@@ -0,0 +1,78 @@
+class CsvSink:
+    '''Appends chunks to one CSV file, the header is written with the first chunk'''
+
+    def __init__(self, path: str, **to_csv_kwargs):
+        self.path = path
+        self.kwargs = {'index': False, **to_csv_kwargs}
+        self.written = False
+
+    def write(self, df):
+        df.to_csv(self.path, mode='a' if self.written else 'w', header=not self.written, **self.kwargs)
+        self.written = True
+
+    def close(self):
+        pass
+
+
+class ParquetSink:
+    '''
+    Writes chunks as row groups of one Parquet file (needs pyarrow).
+    The schema is taken from the first chunk, later chunks are cast to it.
+    '''
+
+    def __init__(self, path: str, **writer_kwargs):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as e:
+            raise ImportError('ParquetSink needs pyarrow: pip install pyarrow') from e
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self.path = path
+        self.kwargs = writer_kwargs
+        self.writer = None
+
+    def write(self, df):
+        if self.writer is None:
+            table = self._pa.Table.from_pandas(df, preserve_index=False)
+            self.writer = self._pq.ParquetWriter(self.path, table.schema, **self.kwargs)
+        else:
+            table = self._pa.Table.from_pandas(df, schema=self.writer.schema, preserve_index=False)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+class CallbackSink:
+    '''Passes every chunk to func'''
+
+    def __init__(self, func):
+        self.func = func
+
+    def write(self, df):
+        self.func(df)
+
+    def close(self):
+        pass
+
+
+def consume(chunks, sink):
+    '''
+    Feeds DataFrame chunks (e.g. Moex.iter_candles) into a sink one at a time and
+    closes it. A plain callable is wrapped in CallbackSink. Returns the number of rows written.
+    Example:
+        consume(Moex('SBER').iter_candles('2015-01-01', interval=1), ParquetSink('sber.parquet'))
+    '''
+    if not hasattr(sink, 'write'):
+        sink = CallbackSink(sink)
+    rows = 0
+    try:
+        for df in chunks:
+            if len(df) > 0:
+                sink.write(df)
+                rows += len(df)
+    finally:
+        sink.close()
+    return rows
@@ -0,0 +1,143 @@
+import time
+import random
+import threading
+import contextvars
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# responses worth retrying: rate limiting and temporary server errors
+retry_statuses = {429, 500, 502, 503, 504}
+# HostLimiter applied by url_reader.read_url to every request of the current context,
+# set by async_reader.AsyncReader and carried into worker threads by instrumentation.bind
+host_limiter = contextvars.ContextVar('host_limiter', default=None)
+
+
+def pooled_session(pool_size: int = 32):
+    '''Returns a requests.Session whose connection pool fits pool_size concurrent requests'''
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class TokenBucket:
+    '''
+    Thread-safe token bucket: rate tokens per second, at most capacity stored.
+    acquire() blocks until a token is available.
+    '''
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class HostLimiter:
+    '''
+    Thread-safe bound on the number of requests in flight to the same host.
+    wrap(session) returns a session whose get() holds a slot of the url host while it runs.
+    '''
+
+    def __init__(self, max_per_host: int):
+        self.max_per_host = max_per_host
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    def _semaphore(self, host):
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._semaphores[host]
+
+    def get(self, session, url: str, **kwargs):
+        with self._semaphore(urlsplit(url).netloc):
+            return session.get(url, **kwargs)
+
+    def wrap(self, session):
+        return LimitedSession(session, self)
+
+
+class LimitedSession:
+    '''Session wrapper sending every get() through a HostLimiter'''
+
+    def __init__(self, session, limiter: HostLimiter):
+        self.session = session
+        self.limiter = limiter
+
+    def get(self, url: str, **kwargs):
+        return self.limiter.get(self.session, url, **kwargs)
+
+
+class Transport:
+    '''
+    HTTP transport used by url_reader.read_url in place of a bare requests.Session.
+    - pool_size: connections kept per host, should cover the number of worker threads
+    - connect_timeout, read_timeout: seconds, a stalled connection fails instead of hanging
+    - retries: extra attempts on connection errors, timeouts and 429/5xx responses
+    - backoff, max_backoff: exponential backoff base and cap in seconds, with full jitter;
+      a Retry-After header on 429/503 takes precedence
+    - rate, burst: client-side limit in requests per second shared by all threads, None for no limit
+
+    Example:
+        set_transport(Transport(rate=10, read_timeout=60))
+    '''
+
+    def __init__(self,
+                 pool_size: int = 32,
+                 connect_timeout: float = 5,
+                 read_timeout: float = 30,
+                 retries: int = 4,
+                 backoff: float = 0.5,
+                 max_backoff: float = 30,
+                 rate: float = None,
+                 burst: float = None,
+                 session=None):
+        self.session = session if session is not None else pooled_session(pool_size)
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.bucket = TokenBucket(rate, burst) if rate else None
+
+    def _delay(self, attempt, response=None):
+        if response is not None and response.headers.get('Retry-After', '').isdigit():
+            return min(self.max_backoff, float(response.headers['Retry-After']))
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def get(self, url: str, **kwargs):
+        '''Same signature as requests.Session.get, the response of the last attempt is returned'''
+        kwargs.setdefault('timeout', self.timeout)
+        for attempt in range(self.retries + 1):
+            if self.bucket is not None:
+                self.bucket.acquire()
+            try:
+                response = self.session.get(url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries:
+                    raise
+                time.sleep(self._delay(attempt))
+                continue
+            if response.status_code not in retry_statuses or attempt == self.retries:
+                response.retries = attempt
+                return response
+            time.sleep(self._delay(attempt, response))
+
+    def close(self):
+        self.session.close()
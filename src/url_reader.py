@@ -1,10 +1,49 @@
-import pandas as pd
+import time
+import itertools
+from collections import deque
+import numpy as np
 import certifi
 import requests
+from concurrent.futures import ThreadPoolExecutor
 import moex_functions as mfunc
+import instrumentation
+from transport import Transport, host_limiter
+
+# a fast JSON parser is used when one is installed
+try:
+    from orjson import loads
+except ImportError:
+    try:
+        from ujson import loads
+    except ImportError:
+        from json import loads
+
+response_cache = None
+transport = Transport()
+# page sizes ISS cuts tables without a cursor at (candles 500, most listings 100)
+page_caps = {100, 500, 1000}
+
+def set_cache(cache=None):
+    """
+    Installs a response_cache.ResponseCache under read_url, None switches caching off.
+    Example:
+        set_cache(ResponseCache(SQLiteBackend('iss_cache.sqlite')))
+    """
+    global response_cache
+    response_cache = cache
+
+def set_transport(new_transport=None):
+    """
+    Replaces the transport.Transport used by read_url when no session is passed,
+    None restores the default one.
+    Example:
+        set_transport(Transport(rate=10))
+    """
+    global transport
+    transport = new_transport if new_transport is not None else Transport()
 
 def read_url(url: str,
-            session = requests.Session(),
+            session = None,
             print_url : bool = False,
             meta: str = None,
             table: str = None,
@@ -15,9 +54,12 @@ def read_url(url: str,
             interval: int = None,
             start: int = None,
             search_ticker : str = None,   
+            columns = None,
+            cache: bool = True,
             **kwargs):
     params = {'iss.meta': meta,
             'iss.only': table,
+            'iss.json': 'compact',
             'limit': limit,
             'date': date,
             'from': date_from,
@@ -25,51 +67,196 @@ def read_url(url: str,
             'interval': interval,
             'start': start,
             'q' : search_ticker}
+    if columns and table:
+        # restricts columns of the first requested table server-side
+        params[table.split(',')[0] + '.columns'] = columns if isinstance(columns, str) else ','.join(columns)
     headers = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:66.0) Gecko/20100101 Firefox/66.0",
         "Accept-Encoding": "*",
         "Connection": "keep-alive"}
+    template = url
     url = url % kwargs
-    response = session.get(url,
-                        headers=headers,
-                        params=params,
-                        verify=certifi.where(),
-                        json=True)
+    session = transport if session is None else session
+    limiter = host_limiter.get()
+    if limiter is not None:
+        session = limiter.wrap(session)
+    t0 = time.perf_counter() if instrumentation.hooks else None
+    try:
+        if response_cache is not None and cache:
+            response = response_cache.get(session,
+                                          url,
+                                          params,
+                                          headers=headers,
+                                          verify=certifi.where(),
+                                          json=True)
+        else:
+            response = session.get(url,
+                                headers=headers,
+                                params=params,
+                                verify=certifi.where(),
+                                json=True)
+    except Exception as e:
+        if t0 is not None:
+            instrumentation.emit('request', endpoint=instrumentation.endpoint(template), url=url, params=params,
+                                 status=None, seconds=time.perf_counter() - t0, error=repr(e))
+        raise
+    if t0 is not None:
+        response.iss_endpoint = instrumentation.endpoint(template)
+        instrumentation.emit('request',
+                             endpoint=response.iss_endpoint,
+                             url=url,
+                             params=params,
+                             status=response.status_code,
+                             seconds=time.perf_counter() - t0,
+                             elapsed=response.elapsed.total_seconds() if response.elapsed else None,
+                             bytes=len(response.content),
+                             cache=getattr(response, 'from_cache', None) if response_cache is not None else None,
+                             retries=getattr(response, 'retries', 0))
     if print_url:
         return print(response.url)
     return response
 
-def read_url_loop(url, table : str, **kwargs):
-    iter = 0
-    start = 0
-    data_list = []
-    while True:
+def decode(response):
+    """Parses the JSON body of an ISS response"""
+    if not instrumentation.hooks:
+        return loads(response.content)
+    start = time.perf_counter()
+    data = loads(response.content)
+    instrumentation.emit('decode', endpoint=getattr(response, 'iss_endpoint', None),
+                         seconds=time.perf_counter() - start, bytes=len(response.content))
+    return data
+
+def to_frame(data, columns, metadata, endpoint: str = None):
+    """Builds a typed DataFrame from ISS rows with moex_functions.make_frame"""
+    if not instrumentation.hooks:
+        return mfunc.make_frame(data, columns, metadata)
+    start = time.perf_counter()
+    df = mfunc.make_frame(data, columns, metadata)
+    instrumentation.emit('convert', endpoint=endpoint, seconds=time.perf_counter() - start, rows=len(df))
+    return df
+
+def read_page(url, table: str, start: int = 0, retries: int = 3, **kwargs):
+    """
+    Reads one page of a table as parsed JSON.
+    A transport.Transport retries requests itself, so the page is retried (up to retries
+    attempts) only for other sessions.
+    """
+    session = kwargs.get('session')
+    if isinstance(transport if session is None else session, Transport):
+        retries = 1
+    for attempt in range(retries):
         try:
-          response = read_url(url, table = table, start = start, **kwargs)          
-          data_list.append(response.json())
-          start += 100
-          if len(response[table]['data']) == 0:
-              break		
-        except:
-            iter += 1
-            if iter > 5:
-                break        
-    return data_list
+            response = read_url(url, table=table, start=start, **kwargs)
+            response.raise_for_status()
+            return decode(response)
+        except (requests.RequestException, ValueError):
+            if attempt == retries - 1:
+                raise
+
+def iter_pages(url, table: str, prefetch: int = 8, retries: int = 3, **kwargs):
+    """
+    Yields parsed JSON pages of a table in order as they arrive.
+    The first page also requests the ISS <table>.cursor table (INDEX/TOTAL/PAGESIZE);
+    when it is present the remaining page offsets are known, otherwise they are
+    guessed from the size of the first page and reading stops at the first short page.
+    A first page that is not full (shorter than an ISS page cap and the requested limit)
+    is the only one and no more pages are requested.
+    At most prefetch pages are requested ahead of the consumer, so memory stays
+    bounded however long the table is. Empty pages after the first are not yielded.
+    """
+    start_time = time.perf_counter() if instrumentation.hooks else None
+    cursor = table + '.cursor'
+    first = read_page(url, table + ',' + cursor, 0, retries, **kwargs)
+    size = len(first[table]['data'])
+    if cursor in first and len(first[cursor]['data']) > 0:
+        info = dict(zip(first[cursor]['columns'], first[cursor]['data'][0]))
+        starts = iter(range(info['INDEX'] + info['PAGESIZE'], info['TOTAL'], info['PAGESIZE']))
+        size = None
+    else:
+        limit = str(kwargs.get('limit'))
+        full = size in page_caps or (limit.isdigit() and size == int(limit))
+        starts = itertools.count(size, size) if size > 0 and full else iter(())
+    pages, rows = 1, len(first[table]['data'])
+    page_reader = instrumentation.bind(read_page)
+    pool = ThreadPoolExecutor(max_workers=max(1, prefetch))
+    pending = deque(pool.submit(page_reader, url, table, start, retries, **kwargs)
+                    for start in itertools.islice(starts, max(1, prefetch)))
+    try:
+        yield first
+        while pending:
+            page = pending.popleft().result()
+            count = len(page[table]['data'])
+            if size is not None and count < size:
+                if count > 0:
+                    pages, rows = pages + 1, rows + count
+                    yield page
+                break
+            start = next(starts, None)
+            if start is not None:
+                pending.append(pool.submit(page_reader, url, table, start, retries, **kwargs))
+            pages, rows = pages + 1, rows + count
+            yield page
+    finally:
+        for future in pending:
+            future.cancel()
+        pool.shutdown(wait=True)
+    if start_time is not None:
+        instrumentation.emit('pages', endpoint=instrumentation.endpoint(url), pages=pages, rows=rows,
+                             seconds=time.perf_counter() - start_time)
+
+def read_url_loop(url, table: str, max_workers: int = 8, retries: int = 3, **kwargs):
+    """Reads all pages of a table and returns a list of parsed JSON pages in order (see iter_pages)."""
+    return list(iter_pages(url, table, prefetch=max_workers, retries=retries, **kwargs))
+
+def pages_to_array(pages, table: str):
+    """
+    Fills one preallocated 2-D object array with the data of all pages.
+    Row lists of every page are released as soon as the page is copied.
+    """
+    width = len(pages[0][table]['columns'])
+    values = np.empty((sum(len(page[table]['data']) for page in pages), width), dtype='object')
+    row = 0
+    for page in pages:
+        data = page[table]['data']
+        if data:
+            values[row:row + len(data)] = data
+        row += len(data)
+        page[table]['data'] = None
+    return values
 
 def loop_processed(url, table :str, **kwargs):
     response = read_url_loop(url, table, **kwargs)
     meta = response[0][table]['metadata']
     cols = response[0][table]['columns']
-    data = [x for sub in [x[table]['data'] for x in response] for x in sub]
-    df = pd.DataFrame(data, columns=cols)
-    df = mfunc.make_new_types(df, meta)
+    df = to_frame(pages_to_array(response, table), cols, meta, instrumentation.endpoint(url))
     return df
    
 def url_processed(url, table: str, **kwargs):
-    response = read_url(url, **kwargs).json()[table]
-    df = pd.DataFrame(response['data'], columns=response['columns'])
-    df = mfunc.make_new_types(df, response['metadata'])
+    response = read_url(url, table=table, **kwargs)
+    data = decode(response)[table]
+    df = to_frame(data['data'], data['columns'], data['metadata'], getattr(response, 'iss_endpoint', None))
     return df
 
+def iter_processed(url, table: str, prefetch: int = 8, **kwargs):
+    """
+    Yields a typed DataFrame for every page of a table (see iter_pages).
+    All chunks share the columns and types of the first page.
+    """
+    endpoint = instrumentation.endpoint(url)
+    columns = meta = None
+    for page in iter_pages(url, table, prefetch=prefetch, **kwargs):
+        data = page[table]
+        if columns is None:
+            columns, meta = data['columns'], data['metadata']
+        yield to_frame(data['data'], columns, meta, endpoint)
 
-
+def tables_processed(url, tables: list, **kwargs):
+    """
+    Reads several tables from one response using the multi-table iss.only form.
+    Returns a dict {table: DataFrame}, tables missing from the response are skipped.
+    """
+    response = read_url(url, table=','.join(tables), **kwargs)
+    data = decode(response)
+    endpoint = getattr(response, 'iss_endpoint', None)
+    return {t: to_frame(data[t]['data'], data[t]['columns'], data[t]['metadata'], endpoint)
+            for t in tables if t in data}
@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+
+# constants of the MOEX zero-coupon yield curve (G-curve) model
+K = 1.6
+A = np.concatenate([[0.0], 0.6 * np.cumsum(K ** np.arange(0, 8))])
+B = 0.6 * K ** np.arange(0, 9)
+
+
+def g_curve(b0, b1, b2, t1, g, t):
+    '''
+    Returns G(t) in basis points.
+    b0, b1, b2, t1 broadcast against t; g holds the nine g-parameters on its last axis.
+    '''
+    t = np.asarray(t, dtype='float64')
+    g = np.asarray(g, dtype='float64')
+    gauss = np.exp(-(t[..., None] - A) ** 2 / B ** 2)
+    dl = np.sum(g * gauss, axis=-1)
+    e = np.exp(-t / t1)
+    dr = b0 + (b1 + b2) * (t1 / t) * (1 - e) - b2 * e
+    return dl + dr
+
+
+class ZCurve:
+    '''
+    Vectorized evaluator of the MOEX G-curve over many dates and maturities.
+    params is a table from Moex.get_zcurve_params or Moex.get_zcurve_params_history:
+    b0, b1, b2, t1 columns followed by the nine g-parameters as the last columns.
+
+    Example:
+        curve = ZCurve(Moex.get_zcurve_params_history())
+        yields, discounts = curve.evaluate(np.linspace(0.25, 30, 120), dates=['2024-01-10', '2024-02-15'])
+    '''
+
+    def __init__(self, params: pd.DataFrame):
+        if 'tradedate' in params.columns:
+            params = params.sort_values(by='tradedate', kind='stable')
+            self.dates = pd.to_datetime(params['tradedate']).values.astype('datetime64[ns]')
+        else:
+            self.dates = None
+        self.b0 = params['b0'].to_numpy(dtype='float64')
+        self.b1 = params['b1'].to_numpy(dtype='float64')
+        self.b2 = params['b2'].to_numpy(dtype='float64')
+        self.t1 = params['t1'].to_numpy(dtype='float64')
+        self.g = params.iloc[:, -9:].to_numpy(dtype='float64')
+
+    def rows(self, dates=None):
+        '''Returns parameter row numbers in effect on dates: the last trade date on or before each date'''
+        if dates is None:
+            return np.arange(len(self.b0))
+        if self.dates is None:
+            raise ValueError('params have no tradedate column')
+        dates = pd.to_datetime(np.atleast_1d(dates)).values.astype('datetime64[ns]')
+        rows = np.searchsorted(self.dates, dates, side='right') - 1
+        if (rows < 0).any():
+            raise ValueError(f'no curve params before {pd.Timestamp(self.dates[0]).date()}')
+        return rows
+
+    def evaluate(self, maturities, dates=None, grid: bool = True):
+        '''
+        Returns (yields in %, discount factors).
+        - grid=True: matrices of shape (dates, maturities)
+        - grid=False: dates and maturities are paired element-wise
+        dates=None evaluates every row of params.
+        '''
+        rows = self.rows(dates)
+        t = np.asarray(maturities, dtype='float64')
+        if grid:
+            rows = rows[:, None]
+            t = np.atleast_1d(t)[None, :]
+        g = g_curve(self.b0[rows], self.b1[rows], self.b2[rows], self.t1[rows], self.g[rows], t)
+        y = 10000 * (np.exp(g / 10000) - 1)
+        d = 1 / (1 + y / 10000) ** t
+        return y / 100, d
+
+    def yields(self, maturities, dates=None, grid: bool = True):
+        '''Returns zero-coupon yields in %'''
+        return self.evaluate(maturities, dates, grid)[0]
+
+    def discount_factors(self, maturities, dates=None, grid: bool = True):
+        '''Returns discount factors'''
+        return self.evaluate(maturities, dates, grid)[1]